@@ -1,32 +1,152 @@
 import logging
 import os
+import time
 from datetime import datetime
-from typing import Optional
+from pathlib import Path
+from typing import Iterator, Optional
 
 import pandas as pd
+import pyarrow as pa
 from dotenv import load_dotenv
 from sqlalchemy import (
     Boolean,
+    Column,
     DateTime,
     ForeignKey,
     Integer,
     String,
+    Table,
     Text,
+    bindparam,
     create_engine,
+    event,
     func,
+    inspect,
+    select,
     text,
+    tuple_,
+    update,
 )
-from sqlalchemy.orm import DeclarativeBase, Mapped, Session, mapped_column
-from tqdm import tqdm
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+from sqlalchemy.sql import ColumnElement, Executable
+
+from ospo_stats.github.parser import write_parquet
 
 load_dotenv()
 TURSO_DB_URL = os.getenv("TURSO_DB_URL")
 TURSO_AUTH_TOKEN = os.getenv("TURSO_AUTH_TOKEN")
-ENGINE = create_engine(
-    f"sqlite+{TURSO_DB_URL}/?authToken={TURSO_AUTH_TOKEN}&secure=true",
-    connect_args={"check_same_thread": False},
-    echo=False,
-)
+DEFAULT_DB_PATH = Path("data/ospo_stats.db")
+BACKENDS = ("remote", "local", "replica")
+
+# Pragmas of local SQLite files, for one writer with concurrent readers
+_LOCAL_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",  # Durable at checkpoints, safe from corruption
+    "busy_timeout": 60_000,  # Milliseconds
+    "cache_size": -64_000,  # KiB
+    "mmap_size": 256 * 2**20,
+    "temp_store": "MEMORY",
+}
+
+
+def create_remote_engine(url: str, auth_token: str | None) -> Engine:
+    """Engine of a remote Turso database, every query is a round trip."""
+
+    return create_engine(
+        f"sqlite+{url}/?authToken={auth_token}&secure=true",
+        connect_args={"check_same_thread": False},
+        echo=False,
+    )
+
+
+def create_local_engine(path: Path | str = DEFAULT_DB_PATH) -> Engine:
+    """Engine of a local SQLite file, in WAL mode with `_LOCAL_PRAGMAS`."""
+
+    Path(path).parent.mkdir(exist_ok=True, parents=True)
+    engine = create_engine(
+        f"sqlite:///{path}", connect_args={"check_same_thread": False}, echo=False
+    )
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record) -> None:
+        for name, value in _LOCAL_PRAGMAS.items():
+            dbapi_connection.execute(f"PRAGMA {name} = {value}")
+
+    return engine
+
+
+def create_replica_engine(
+    path: Path | str,
+    sync_url: str,
+    auth_token: str | None,
+    sync_interval: float = 60.0,
+) -> Engine:
+    """Engine of a libsql embedded replica of a remote Turso database.
+
+    Reads are served by the local file, which pulls the changes of the remote
+    database when a connection opens and every `sync_interval` seconds in the
+    background. Writes go to the remote database, see `sync_replica` to read
+    them back at once.
+    """
+
+    Path(path).parent.mkdir(exist_ok=True, parents=True)
+    engine = create_engine(
+        f"sqlite+libsql:///{Path(path).absolute()}",
+        connect_args={
+            "check_same_thread": False,
+            "sync_url": sync_url,
+            "auth_token": auth_token or "",
+            "sync_interval": sync_interval,
+        },
+        echo=False,
+    )
+
+    @event.listens_for(engine, "connect")
+    def sync(dbapi_connection, connection_record) -> None:
+        dbapi_connection.sync()
+
+    return engine
+
+
+def sync_replica(engine: Engine | None = None) -> None:
+    """Pull the changes of the remote database into an embedded replica now."""
+
+    with (engine or ENGINE).connect() as conn:
+        conn.connection.dbapi_connection.sync()
+
+
+def create_engine_from_env() -> Engine:
+    """Create the engine of the backend chosen by `DB_BACKEND`.
+
+    - "remote": the Turso database at `TURSO_DB_URL`, the default when it is set
+    - "local": a SQLite file at `DB_PATH`, the default otherwise
+    - "replica": an embedded replica of `TURSO_DB_URL` at `DB_PATH`, synced
+      every `DB_SYNC_INTERVAL` seconds
+    """
+
+    backend = os.getenv("DB_BACKEND") or ("remote" if TURSO_DB_URL else "local")
+    path = os.getenv("DB_PATH") or DEFAULT_DB_PATH
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown DB_BACKEND {backend!r}, expected one of {BACKENDS}")
+    if backend != "local" and not TURSO_DB_URL:
+        raise ValueError(f"DB_BACKEND={backend} needs TURSO_DB_URL")
+
+    logging.info(f"Using the {backend} database backend")
+    if backend == "remote":
+        return create_remote_engine(TURSO_DB_URL, TURSO_AUTH_TOKEN)
+    if backend == "replica":
+        sync_interval = float(os.getenv("DB_SYNC_INTERVAL", "60"))
+        return create_replica_engine(
+            path, TURSO_DB_URL, TURSO_AUTH_TOKEN, sync_interval
+        )
+    return create_local_engine(path)
+
+
+ENGINE = create_engine_from_env()
+PUSH_BATCH_SIZE = 500  # Rows per executemany and transaction
+EXPORT_BATCH_SIZE = 10_000  # Rows per query and record batch
 
 
 class Base(DeclarativeBase):
@@ -41,6 +161,8 @@ class Repo(Base):
     crawl_at: Mapped[datetime] = mapped_column(
         DateTime, default=func.current_timestamp()
     )
+    # Last time its commits and stargazers were crawled, see `plan_refresh`
+    history_crawled_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
     created_at: Mapped[datetime] = mapped_column(DateTime)
     owner: Mapped[str] = mapped_column(String(256))
     name: Mapped[str] = mapped_column(String(256))
@@ -51,7 +173,9 @@ class Repo(Base):
     license_name: Mapped[Optional[str]] = mapped_column(String(256))
     readme: Mapped[Optional[str]] = mapped_column(Text)
     readme_has_image: Mapped[Optional[bool]] = mapped_column(Boolean)
+    readme_oid: Mapped[Optional[str]] = mapped_column(String(40))  # Git blob id
     total_stargazer_count: Mapped[int] = mapped_column(Integer)
+    total_commit_count: Mapped[Optional[int]] = mapped_column(Integer)
     total_issues_count: Mapped[int] = mapped_column(Integer)
     total_open_issues_count: Mapped[int] = mapped_column(Integer)
     total_forks_count: Mapped[int] = mapped_column(Integer)
@@ -68,7 +192,9 @@ class Commit(Base):
 
     __tablename__ = "commit_history"
     url: Mapped[str] = mapped_column(String(1024), primary_key=True)
-    repo_url: Mapped[str] = mapped_column(String(1024), ForeignKey("repo.url"))
+    repo_url: Mapped[str] = mapped_column(
+        String(1024), ForeignKey("repo.url"), index=True
+    )
     committed_at: Mapped[datetime] = mapped_column(DateTime)
     additions: Mapped[int] = mapped_column(Integer)
     deletions: Mapped[int] = mapped_column(Integer)
@@ -86,7 +212,9 @@ class Stargazer(Base):
     id: Mapped[str] = mapped_column(
         String(1281), primary_key=True
     )  # f"{repo_url}/{user}"
-    repo_url: Mapped[str] = mapped_column(String(1024), ForeignKey("repo.url"))
+    repo_url: Mapped[str] = mapped_column(
+        String(1024), ForeignKey("repo.url"), index=True
+    )
     user: Mapped[str] = mapped_column(String(256))
     starred_at: Mapped[datetime] = mapped_column(
         DateTime, default=func.current_timestamp()
@@ -96,41 +224,271 @@ class Stargazer(Base):
         return f"Stargazer(repo={self.repo_url}, user={self.user})"
 
 
+class RepoTerm(Base):
+    """Search terms that matched a repo, empty repos included."""
+
+    __tablename__ = "repo_term"
+    repo_url: Mapped[str] = mapped_column(String(1024), primary_key=True)
+    term: Mapped[str] = mapped_column(String(256), primary_key=True)
+
+    def __repr__(self) -> str:
+        return f"RepoTerm(repo={self.repo_url}, term={self.term})"
+
+
 def hard_reset() -> None:
     """Wipe the database and re-create."""
     Base.metadata.drop_all(ENGINE)
     Base.metadata.create_all(ENGINE)
 
 
-def push(objects: list[Commit] | list[Stargazer] | list[Repo]):
-    """Push repos, commits or stargazers to Turso."""
-
-    with Session(ENGINE).no_autoflush as session:
-        for i, commit in tqdm(enumerate(objects)):
-            logging.info(f"Pushing {commit}")
-            session.merge(commit)
-            if (i + 1) % 100 == 0:  # commit every 100 items
-                session.flush()
-                session.commit()
-        session.flush()
-        session.commit()  # commit remaining items
-
-
-def export(table: str) -> pd.DataFrame | None:
-    """Export a table from Turso to a DataFrame."""
-    batch_size = 500
-    dfs = []
-    with ENGINE.connect() as conn:
-        total_rows = conn.execute(text(f"SELECT COUNT(*) FROM {table}")).fetchone()
-        if total_rows is None:
-            return None
-        total_rows = total_rows[0]
-
-        for i in range(0, total_rows, batch_size):
-            print(f"Fetching rows {i} to {i+batch_size}")
-            df = pd.read_sql(
-                f"SELECT * FROM {table} LIMIT {batch_size} OFFSET {i}", conn
+def create_missing_tables() -> None:
+    """Create the tables defined in the ORM that do not exist yet."""
+    Base.metadata.create_all(ENGINE)
+
+
+def add_missing_columns() -> None:
+    """Add the columns defined in the ORM to the existing tables that lack them."""
+
+    inspector = inspect(ENGINE)
+    with ENGINE.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                logging.info(f"Adding column {table.name}.{column.name}")
+                column_type = column.type.compile(ENGINE.dialect)
+                conn.execute(
+                    text(
+                        f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                    )
+                )
+
+
+def create_missing_indexes() -> None:
+    """Create the indexes defined in the ORM that existing tables lack."""
+
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(ENGINE, checkfirst=True)
+
+
+def _upsert_statement(table: Table, columns: list[str]) -> Executable:
+    """`INSERT ... ON CONFLICT DO UPDATE` of rows setting `columns`."""
+
+    primary_key = [column.name for column in table.primary_key]
+    statement = insert(table)
+    updates = {
+        name: statement.excluded[name] for name in columns if name not in primary_key
+    }
+    if updates:
+        return statement.on_conflict_do_update(index_elements=primary_key, set_=updates)
+    return statement.on_conflict_do_nothing(index_elements=primary_key)
+
+
+def _update_statement(table: Table, columns: list[str]) -> Executable:
+    """`UPDATE` by primary key of rows setting `columns`, with parameters named
+    `b_{column}` since SQLAlchemy reserves the column names."""
+
+    primary_key = [column.name for column in table.primary_key]
+    return (
+        update(table)
+        .where(*(table.c[name] == bindparam(f"b_{name}") for name in primary_key))
+        .values(
+            {
+                name: bindparam(f"b_{name}")
+                for name in columns
+                if name not in primary_key
+            }
+        )
+    )
+
+
+def _upsert(engine: Engine, table: Table, rows: list[dict], batch_size: int) -> None:
+    """Insert or update rows that set the same columns, `batch_size` at a time.
+
+    Each batch is one `executemany` of `INSERT ... ON CONFLICT DO UPDATE`, in
+    its own transaction. Only the columns of the rows are updated, so existing
+    rows keep their other columns, and column defaults apply to new rows only.
+
+    SQLite checks NOT NULL constraints before conflicts, so rows missing a
+    required column, which can only update existing rows like `session.merge`
+    of a partial object, are updated by primary key instead.
+    """
+
+    if not rows:
+        return
+
+    columns = list(rows[0])
+    required = {
+        column.name
+        for column in table.columns
+        if not column.nullable
+        and column.default is None
+        and column.server_default is None
+    }
+    if required <= set(columns):
+        statement = _upsert_statement(table, columns)
+    else:
+        statement = _update_statement(table, columns)
+        rows = [{f"b_{name}": value for name, value in row.items()} for row in rows]
+
+    start = time.perf_counter()
+    for i in range(0, len(rows), batch_size):
+        with engine.begin() as conn:
+            conn.execute(statement, rows[i : i + batch_size])
+    seconds = time.perf_counter() - start
+    logging.info(
+        f"Pushed {len(rows)} rows to {table.name} in {seconds:.2f}s"
+        f" ({len(rows) / seconds:.0f} rows/s)"
+    )
+
+
+def push(
+    objects: list[Commit] | list[Stargazer] | list[Repo] | list[RepoTerm],
+    batch_size: int = PUSH_BATCH_SIZE,
+    engine: Engine | None = None,
+) -> None:
+    """Push repos, commits, stargazers or repo terms to Turso.
+
+    Objects are upserted in bulk, see `_upsert`, grouped by table and by the
+    columns they set: like `session.merge`, an object with only some columns
+    set updates those columns of an existing row.
+    """
+
+    groups = {}
+    for obj in objects:
+        table = obj.__table__
+        row = {
+            column.key: obj.__dict__[column.key]
+            for column in table.columns
+            if column.key in obj.__dict__
+        }
+        groups.setdefault((table, tuple(row)), []).append(row)
+
+    for (table, _), rows in groups.items():
+        _upsert(engine or ENGINE, table, rows, batch_size)
+
+
+def push_batch(
+    model: type[Base],
+    batch: pa.RecordBatch | pa.Table,
+    batch_size: int = PUSH_BATCH_SIZE,
+    engine: Engine | None = None,
+) -> None:
+    """Upsert the rows of an Arrow batch into the table of an ORM model.
+
+    Only the columns of the batch are written, so existing rows keep their
+    other columns, like `push`.
+    """
+
+    _upsert(engine or ENGINE, model.__table__, batch.to_pylist(), batch_size)
+
+
+# Arrow types of the Python types of the columns, for `export_batches`
+_ARROW_TYPES = {
+    datetime: pa.timestamp("us"),
+    str: pa.string(),
+    int: pa.int64(),
+    bool: pa.bool_(),
+}
+
+
+def _export_columns(table: str, columns: list[str] | None) -> list[Column]:
+    table_ = Base.metadata.tables[table]
+    return [table_.c[name] for name in columns] if columns else list(table_.columns)
+
+
+def _arrow_schema(columns: list[Column]) -> pa.Schema:
+    return pa.schema(
+        [
+            pa.field(column.name, _ARROW_TYPES[column.type.python_type])
+            for column in columns
+        ]
+    )
+
+
+def export_batches(
+    table: str,
+    columns: list[str] | None = None,
+    where: str | ColumnElement | None = None,
+    batch_size: int = EXPORT_BATCH_SIZE,
+    engine: Engine | None = None,
+) -> Iterator[pa.RecordBatch]:
+    """Stream the rows of a table in record batches, in primary key order.
+
+    Each batch is one query for the rows after the last key of the previous
+    one, so the cost of a batch does not grow with the rows before it.
+    `columns` selects the columns, all by default, and `where` filters the
+    rows, with a SQL condition like `"repo_url = 'https://github.com/a/b'"` or
+    a SQLAlchemy expression.
+    """
+
+    selected = _export_columns(table, columns)
+    primary_key = list(Base.metadata.tables[table].primary_key)
+    schema = _arrow_schema(selected)
+
+    statement = select(*selected, *primary_key).order_by(*primary_key)
+    if isinstance(where, str):
+        where = text(f"({where})")  # Keep its ORs apart from the key condition
+    if where is not None:
+        statement = statement.where(where)
+    statement = statement.limit(batch_size)
+
+    last_key = None
+    with (engine or ENGINE).connect() as conn:
+        while True:
+            page = statement
+            if last_key is not None:
+                page = page.where(tuple_(*primary_key) > tuple_(*last_key))
+            rows = conn.execute(page).fetchall()
+            if not rows:
+                return
+
+            values = list(zip(*rows))
+            yield pa.RecordBatch.from_arrays(
+                [pa.array(values[i], field.type) for i, field in enumerate(schema)],
+                schema=schema,
             )
-            dfs.append(df)
+            last_key = rows[-1][len(selected) :]
+            if len(rows) < batch_size:
+                return
+
+
+def export_parquet(
+    table: str,
+    path: Path | str,
+    columns: list[str] | None = None,
+    where: str | ColumnElement | None = None,
+    batch_size: int = EXPORT_BATCH_SIZE,
+    engine: Engine | None = None,
+) -> int:
+    """Write a table to a Parquet file a batch at a time, return the rows.
+
+    See `export_batches` for the options.
+    """
+
+    batches = export_batches(table, columns, where, batch_size, engine)
+    schema = _arrow_schema(_export_columns(table, columns))
+    n_rows = write_parquet(batches, path, schema)
+    logging.info(f"Exported {n_rows} rows of {table} to {path}")
+    return n_rows
+
+
+def export(
+    table: str,
+    columns: list[str] | None = None,
+    where: str | ColumnElement | None = None,
+    batch_size: int = EXPORT_BATCH_SIZE,
+    engine: Engine | None = None,
+) -> pd.DataFrame:
+    """Export a table from Turso to a DataFrame, see `export_batches`.
+
+    The whole table is held in memory, use `export_parquet` for large ones.
+    """
 
-    return pd.concat(dfs).reset_index(drop=True)
+    batches = export_batches(table, columns, where, batch_size, engine)
+    schema = _arrow_schema(_export_columns(table, columns))
+    return pa.Table.from_batches(batches, schema).to_pandas()
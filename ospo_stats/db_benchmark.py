@@ -0,0 +1,127 @@
+"""Benchmark pushes to a local SQLite file, bulk upserts against session merges.
+
+    python -m ospo_stats.db_benchmark --rows 20000 --batch-sizes 100 500 2000
+
+Each run pushes the same synthetic repos, commits and stargazers twice to a
+fresh database: first as inserts, then as updates of the existing rows.
+"""
+
+import argparse
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from ospo_stats.db import Base, Commit, Repo, Stargazer, push
+
+
+def make_objects(n_rows: int) -> dict[str, list[Base]]:
+    """Synthetic repos, and `n_rows` commits and stargazers spread over them."""
+
+    n_repos = max(1, n_rows // 100)
+    start = datetime(2020, 1, 1)
+    urls = [f"https://github.com/synthetic/repo-{i}" for i in range(n_repos)]
+    repos = [
+        Repo(
+            url=url,
+            created_at=start,
+            owner="synthetic",
+            name=url.rsplit("/", 1)[1],
+            description="Synthetic repository",
+            total_stargazer_count=n_rows // n_repos,
+            total_commit_count=n_rows // n_repos,
+            total_issues_count=0,
+            total_open_issues_count=0,
+            total_forks_count=0,
+            total_watchers_count=0,
+        )
+        for url in urls
+    ]
+    commits = [
+        Commit(
+            url=f"{urls[i % n_repos]}/commit/{i:040x}",
+            repo_url=urls[i % n_repos],
+            committed_at=start + timedelta(minutes=i),
+            additions=i % 100,
+            deletions=i % 10,
+            committer_name=f"user-{i % 500}",
+            committer_email=f"user-{i % 500}@example.com",
+        )
+        for i in range(n_rows)
+    ]
+    stargazers = [
+        Stargazer(
+            id=f"{urls[i % n_repos]}/user-{i}",
+            repo_url=urls[i % n_repos],
+            user=f"user-{i}",
+            starred_at=start + timedelta(minutes=i),
+        )
+        for i in range(n_rows)
+    ]
+    return {"repo": repos, "commit": commits, "stargazer": stargazers}
+
+
+def push_merge(objects: list[Base], engine: Engine) -> None:
+    """How `push` used to work, one `session.merge` per object."""
+
+    with Session(engine).no_autoflush as session:
+        for i, obj in enumerate(objects):
+            session.merge(obj)
+            if (i + 1) % 100 == 0:
+                session.flush()
+                session.commit()
+        session.commit()
+
+
+def benchmark(n_rows: int, batch_sizes: list[int]) -> pd.DataFrame:
+    """Time merges and bulk upserts of each batch size, in rows per second."""
+
+    methods = {"merge": push_merge}
+    for batch_size in batch_sizes:
+        methods[f"upsert ({batch_size})"] = (
+            lambda objects, engine, batch_size=batch_size: push(
+                objects, batch_size, engine
+            )
+        )
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for method, run in methods.items():
+            engine = create_engine(f"sqlite:///{Path(tmp) / method}.db")
+            Base.metadata.create_all(engine)
+            for step in ("insert", "update"):
+                for table, objects in make_objects(n_rows).items():
+                    start = time.perf_counter()
+                    run(objects, engine)
+                    seconds = time.perf_counter() - start
+                    rows.append(
+                        {
+                            "method": method,
+                            "step": step,
+                            "table": table,
+                            "rows": len(objects),
+                            "seconds": seconds,
+                            "rows_per_second": len(objects) / seconds,
+                        }
+                    )
+            engine.dispose()
+    return pd.DataFrame(rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[100, 500, 2000])
+    args = parser.parse_args()
+
+    pd.options.display.float_format = "{:,.2f}".format
+    print(benchmark(args.rows, args.batch_sizes).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
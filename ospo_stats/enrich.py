@@ -4,7 +4,8 @@ from anthropic import Anthropic
 from sqlalchemy.orm import Session
 from tqdm import tqdm
 
-from ospo_stats.db import ENGINE, Repo
+from ospo_stats.db import ENGINE, Repo, add_missing_columns
+from ospo_stats.github.crawl import update_readmes
 from ospo_stats.llm import get_category
 
 
@@ -63,6 +64,9 @@ def update_in_batch(
 
 
 def main():
+    add_missing_columns()
+    # Discovery leaves READMEs out, fetch those of the repos to categorize
+    update_readmes(uncategorized_only=True)
     anthropic_client = Anthropic()
     update_in_batch(batch_size=1, llm_client=anthropic_client, overwrite=False)
 
@@ -0,0 +1,104 @@
+"""Compressed archive of the raw search results of discovery, by term and year.
+
+Each window of a discovery run is a gzip compressed JSON lines file,
+`repos_{term}_{year}.jsonl.gz`, with one search result per line:
+
+    archive = RawArchive("data")
+    archive.append("madison", 2020, page)  # As each page comes in
+    for repo in archive.read(term="madison"):
+        ...
+
+Appends add a gzip member to the file, so pages are written as they come
+without rewriting what is there, and windows are read back as a stream.
+"""
+
+import gzip
+import json
+import re
+import threading
+from pathlib import Path
+from typing import Iterator
+
+ARCHIVE_SUFFIX = ".jsonl.gz"
+LEGACY_SUFFIX = ".json"  # Indented JSON lists, written before the archive
+
+_WINDOW_NAME = re.compile(
+    r"repos_(?P<term>.+)_(?P<year>\d{4})(?P<suffix>\.jsonl\.gz|\.json)"
+)
+
+
+class RawArchive:
+    """Directory of raw search results, one compressed file per term and year.
+
+    Windows saved as indented JSON by earlier versions are read too.
+    """
+
+    def __init__(self, root: Path | str = "data", compresslevel: int = 6) -> None:
+        self.root = Path(root)
+        self.compresslevel = compresslevel
+        self._lock = threading.Lock()
+
+    def path(self, term: str, year: int) -> Path:
+        return self.root / f"repos_{term}_{year}{ARCHIVE_SUFFIX}"
+
+    def windows(self, term: str | None = None) -> list[tuple[str, int]]:
+        """The (term, year) windows in the archive, of `term` only if given."""
+
+        windows = set()
+        for path in self.root.glob("repos_*"):
+            match = _WINDOW_NAME.fullmatch(path.name)
+            if match and (term is None or match["term"] == term):
+                windows.add((match["term"], int(match["year"])))
+        return sorted(windows)
+
+    def append(self, term: str, year: int, repos: list[dict]) -> None:
+        """Add a page of search results to a window."""
+
+        if not repos:
+            return
+        lines = "".join(
+            json.dumps(repo, separators=(",", ":")) + "\n" for repo in repos
+        )
+        self.root.mkdir(exist_ok=True, parents=True)
+        with self._lock:
+            with gzip.open(self.path(term, year), "ab", self.compresslevel) as f:
+                f.write(lines.encode())
+
+    def clear(self, term: str, year: int) -> None:
+        """Delete a window, before it is discovered again."""
+
+        with self._lock:
+            self.path(term, year).unlink(missing_ok=True)
+            self._legacy_path(term, year).unlink(missing_ok=True)
+
+    def _legacy_path(self, term: str, year: int) -> Path:
+        return self.root / f"repos_{term}_{year}{LEGACY_SUFFIX}"
+
+    def window_path(self, term: str, year: int) -> Path | None:
+        """The file of a window, legacy or not, None if it is missing."""
+
+        for path in (self.path(term, year), self._legacy_path(term, year)):
+            if path.exists():
+                return path
+        return None
+
+    def read_window(self, term: str, year: int) -> Iterator[dict]:
+        """Stream the search results of one window, none if it is missing."""
+
+        path = self.window_path(term, year)
+        if path is None:
+            return
+        if path.name.endswith(ARCHIVE_SUFFIX):
+            with gzip.open(path, "rt") as f:
+                for line in f:
+                    yield json.loads(line)
+        else:
+            with open(path) as f:
+                yield from json.load(f)
+
+    def read(self, term: str | None = None, year: int | None = None) -> Iterator[dict]:
+        """Stream the search results of every window, or those of `term` or `year`."""
+
+        for window_term, window_year in self.windows(term):
+            if year is None or window_year == year:
+                yield from self.read_window(window_term, window_year)
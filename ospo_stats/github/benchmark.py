@@ -0,0 +1,200 @@
+"""Benchmark discovery and history crawls against the local GitHub stand-in.
+
+Crawls run against a `SyntheticGitHub` served by `MockGitHub` in another
+process, so no API quota is spent:
+
+    python -m ospo_stats.github.benchmark --repos 2000 --latency 0.05
+
+Each crawl reports the API pages and parsed rows per second, the requests that
+failed and were retried, and the peak memory allocated while it ran.
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import date
+from typing import Awaitable, Callable
+
+from ospo_stats.github.client import GraphQLClient
+from ospo_stats.github.crawl import (
+    discover_window,
+    gather_or_cancel,
+    get_commits,
+    get_commits_batch,
+    get_stargazers,
+    get_stargazers_batch,
+)
+from ospo_stats.github.mock import SyntheticGitHub, serve_in_process
+from ospo_stats.github.parser import (
+    commits_to_batch,
+    get_owner_and_repo_name,
+    repos_to_batch,
+    stargazers_to_batch,
+)
+from ospo_stats.http_client import STATS
+
+BENCHMARK_TERM = "benchmark"
+
+
+@dataclass
+class BenchmarkResult:
+    """Totals of one benchmarked crawl."""
+
+    name: str
+    seconds: float
+    pages: int  # Successful API requests
+    rows: int  # Repos, commits or stargazers parsed into record batches
+    errors: int  # Failed requests, retried
+    peak_memory: int  # Bytes allocated at the peak, see `tracemalloc`
+
+    @property
+    def pages_per_second(self) -> float:
+        return self.pages / self.seconds
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name}: {self.pages} pages, {self.rows} rows in {self.seconds:.2f}s"
+            f" ({self.pages_per_second:.1f} pages/s, {self.rows_per_second:.0f} rows/s),"
+            f" {self.errors} errors, {self.peak_memory / 1e6:.1f} MB peak"
+        )
+
+
+def run_benchmark(
+    name: str, crawl: Callable[[GraphQLClient], Awaitable[int]], **client_options
+) -> BenchmarkResult:
+    """Time a crawl that returns its number of rows, with a fresh client."""
+
+    async def run() -> tuple[int, int]:
+        async with GraphQLClient(**client_options) as client:
+            rows = await crawl(client)
+            return client.pages, rows
+
+    STATS.reset()
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        pages, rows = asyncio.run(run())
+        seconds = time.perf_counter() - start
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    errors = sum(stats.errors for stats in STATS.hosts.values())
+    return BenchmarkResult(name, seconds, pages, rows, errors, peak_memory)
+
+
+async def crawl_discovery(client: GraphQLClient, year_min: int, year_max: int) -> int:
+    """Discover the repos of every year concurrently, return the parsed count."""
+
+    years = await gather_or_cancel(
+        *(
+            discover_window(
+                BENCHMARK_TERM,
+                date(year, 1, 1),
+                date(year, 12, 31),
+                client,
+            )
+            for year in range(year_min, year_max + 1)
+        )
+    )
+    return repos_to_batch(repo for year in years for repo in year).num_rows
+
+
+async def crawl_history(client: GraphQLClient, urls: list[str]) -> int:
+    """Crawl the commits and stargazers of each repo with its own requests."""
+
+    async def crawl(url: str) -> int:
+        owner, name = get_owner_and_repo_name(url)
+        commits, stargazers = await gather_or_cancel(
+            get_commits(owner, name, client), get_stargazers(owner, name, client)
+        )
+        return (
+            commits_to_batch({url: commits}).num_rows
+            + stargazers_to_batch({url: stargazers}).num_rows
+        )
+
+    return sum(await gather_or_cancel(*(crawl(url) for url in urls)))
+
+
+async def crawl_history_batches(
+    client: GraphQLClient, urls: list[str], batch_size: int
+) -> int:
+    """Crawl the commits and stargazers of repos in aliased batches."""
+
+    async def crawl(batch: list[str]) -> int:
+        commits, stargazers = await gather_or_cancel(
+            get_commits_batch(batch, client), get_stargazers_batch(batch, client)
+        )
+        return (
+            commits_to_batch(commits).num_rows
+            + stargazers_to_batch(stargazers).num_rows
+        )
+
+    batches = [urls[i : i + batch_size] for i in range(0, len(urls), batch_size)]
+    return sum(await gather_or_cancel(*(crawl(batch) for batch in batches)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repos", type=int, default=1000, help="Repos per term")
+    parser.add_argument("--commits", type=int, default=100, help="Median per repo")
+    parser.add_argument("--stargazers", type=int, default=20, help="Median per repo")
+    parser.add_argument("--history-repos", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--year-min", type=int, default=2008)
+    parser.add_argument("--year-max", type=int, default=date.today().year)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--bad-gateway-rate", type=float, default=0.0)
+    parser.add_argument("--secondary-limit-rate", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--max-rate", type=float, default=100.0)
+    parser.add_argument("--tokens", type=int, default=1)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    handler_options = {
+        "n_repos": args.repos,
+        "commits": args.commits,
+        "stargazers": args.stargazers,
+        "start_year": args.year_min,
+    }
+    handler = SyntheticGitHub(**handler_options)
+    urls = [
+        handler.get_repo(handler.owner, f"{BENCHMARK_TERM}-{i}").url
+        for i in range(args.history_repos)
+    ]
+    client_options = {
+        "max_concurrency": args.concurrency,
+        "max_rate": args.max_rate,
+        "tokens": [f"benchmark-{i}" for i in range(args.tokens)],
+        "cache": False,  # Measure the crawl, not the cache
+    }
+    benchmarks = {
+        "discovery": lambda client: crawl_discovery(
+            client, args.year_min, args.year_max
+        ),
+        "history": lambda client: crawl_history(client, urls),
+        f"history (batches of {args.batch_size})": lambda client: (
+            crawl_history_batches(client, urls, args.batch_size)
+        ),
+    }
+
+    with serve_in_process(
+        handler_options=handler_options,
+        latency=args.latency,
+        bad_gateway_rate=args.bad_gateway_rate,
+        secondary_limit_rate=args.secondary_limit_rate,
+    ) as url:
+        for name, crawl in benchmarks.items():
+            print(run_benchmark(name, crawl, url=url, **client_options), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_CACHE_PATH = Path("data/cache.sqlite")
+DEFAULT_MAX_BYTES = 1_000_000_000
+
+# Seconds a cached response stays fresh, per kind of query
+DEFAULT_TTLS = {
+    "discover": 7 * 24 * 3600,
+    "stargazers": 24 * 3600,
+    "commits": 24 * 3600,
+    "default": 24 * 3600,
+}
+
+_CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS response (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+)
+"""
+_CREATE_INDEX = (
+    "CREATE INDEX IF NOT EXISTS response_accessed_at ON response (accessed_at)"
+)
+
+
+class CacheMiss(KeyError):
+    """Raised in offline mode when a response is not in the cache."""
+
+
+def get_query_kind(query: str) -> str:
+    """Classify a GraphQL query to pick its TTL."""
+
+    if "search(" in query:
+        return "discover"
+    if "stargazers(" in query:
+        return "stargazers"
+    if "history(" in query:
+        return "commits"
+    return "default"
+
+
+def get_cache_key(query: str, variables: dict | None = None) -> str:
+    """Hash of the query text and variables that identifies a response."""
+
+    payload = json.dumps({"query": query, "variables": variables}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResponseCache:
+    """Local SQLite store of GraphQL responses, compressed with zlib.
+
+    Responses expire after the TTL of their kind of query (see `get_query_kind`),
+    and the least recently used ones are evicted once the cache grows beyond
+    `max_bytes`. In `offline` mode expired responses are still served, and
+    `CacheMiss` is raised instead of querying the API.
+    """
+
+    def __init__(
+        self,
+        path: Path | str = DEFAULT_CACHE_PATH,
+        ttls: dict[str, float] | None = None,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        offline: bool = False,
+    ) -> None:
+        self.path = Path(path)
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(_CREATE_TABLE)
+            self._conn.execute(_CREATE_INDEX)
+            (self._size,) = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM response"
+            ).fetchone()
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache | None":
+        """Open the cache at `GITHUB_CACHE_PATH`, None if the variable is not set.
+
+        `GITHUB_CACHE_OFFLINE=1` turns on the offline mode.
+        """
+
+        path = os.getenv("GITHUB_CACHE_PATH")
+        if not path:
+            return None
+        offline = os.getenv("GITHUB_CACHE_OFFLINE", "0").lower() in ("1", "true")
+        return cls(path, offline=offline)
+
+    def get(self, query: str, variables: dict | None = None) -> dict | None:
+        """Get a cached response, None if it is missing or expired."""
+
+        key = get_cache_key(query, variables)
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM response WHERE key = ?", (key,)
+            ).fetchone()
+            fresh = row is not None and (
+                self.offline or now - row[1] < self.ttls.get(get_query_kind(query), 0)
+            )
+            if fresh:
+                self._conn.execute(
+                    "UPDATE response SET accessed_at = ? WHERE key = ?", (now, key)
+                )
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if not fresh:
+            if self.offline:
+                raise CacheMiss(f"Response not cached in offline mode: {query}")
+            return None
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, query: str, data: dict, variables: dict | None = None) -> None:
+        """Store a response, evicting the least recently used ones if needed."""
+
+        key = get_cache_key(query, variables)
+        value = zlib.compress(json.dumps(data, separators=(",", ":")).encode())
+        now = time.time()
+        with self._lock, self._conn:
+            old = self._conn.execute(
+                "SELECT size FROM response WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response"
+                " (key, kind, value, size, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, get_query_kind(query), value, len(value), now, now),
+            )
+            self._size += len(value) - (old[0] if old else 0)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Delete the least recently used responses until the cache fits."""
+
+        rows = self._conn.execute("SELECT key, size FROM response ORDER BY accessed_at")
+        evicted = []
+        for key, size in rows:
+            if self._size <= self.max_bytes:
+                break
+            evicted.append((key,))
+            self._size -= size
+        self._conn.executemany("DELETE FROM response WHERE key = ?", evicted)
+
+    def clear(self) -> None:
+        """Delete all cached responses."""
+
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM response")
+            self._size = 0
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,95 @@
+import json
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+
+DEFAULT_CHECKPOINT_PATH = Path("data/checkpoints.sqlite")
+
+_CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS checkpoint (
+    key TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    cursor TEXT,
+    rows INTEGER NOT NULL DEFAULT 0,
+    params TEXT NOT NULL DEFAULT '{}',
+    done INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (key, kind)
+)
+"""
+
+
+@dataclass
+class Checkpoint:
+    """Progress of a paginated crawl.
+
+    `cursor` is the `endCursor` of the last page whose `rows` were pushed, and
+    `params` the query options the cursor is only valid with.
+    """
+
+    cursor: str | None = None
+    rows: int = 0
+    params: dict = field(default_factory=dict)
+    done: bool = False
+
+
+class CheckpointStore:
+    """Local SQLite table of crawl checkpoints keyed by (key, kind).
+
+    The key is a repo url or a discovery window, the kind what is crawled,
+    like "commits" or "stargazers".
+    """
+
+    def __init__(self, path: Path | str = DEFAULT_CHECKPOINT_PATH) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(_CREATE_TABLE)
+
+    def get(self, key: str, kind: str) -> Checkpoint | None:
+        """Get the checkpoint of a crawl, None if it never started or was cleared."""
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT cursor, rows, params, done FROM checkpoint"
+                " WHERE key = ? AND kind = ?",
+                (key, kind),
+            ).fetchone()
+        if row is None:
+            return None
+        cursor, rows, params, done = row
+        return Checkpoint(cursor, rows, json.loads(params), bool(done))
+
+    def save(self, key: str, kind: str, checkpoint: Checkpoint) -> None:
+        """Record the progress of a crawl."""
+
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoint"
+                " (key, kind, cursor, rows, params, done, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    kind,
+                    checkpoint.cursor,
+                    checkpoint.rows,
+                    json.dumps(checkpoint.params),
+                    int(checkpoint.done),
+                    datetime.now().isoformat(),
+                ),
+            )
+
+    def clear(self, key: str, kind: str) -> None:
+        """Forget the checkpoint of a crawl."""
+
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM checkpoint WHERE key = ? AND kind = ?", (key, kind)
+            )
+
+    def close(self) -> None:
+        self._conn.close()
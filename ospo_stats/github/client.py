@@ -0,0 +1,355 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+
+import httpx
+import tenacity
+from dotenv import load_dotenv
+
+from ospo_stats.github.cache import ResponseCache
+from ospo_stats.http_client import make_async_client
+
+load_dotenv()
+
+GITHUB_GRAPHQL_URL = "https://api.github.com/graphql"
+
+
+class RateLimitExceeded(Exception):
+    """Raised when GitHub rejects a request due to a primary or secondary rate limit."""
+
+
+@dataclass
+class RateLimit:
+    """Latest rate limit state reported by GitHub through the `X-RateLimit-*` headers."""
+
+    limit: int = 5000
+    remaining: int = 5000
+    reset_at: float = 0.0  # Unix epoch seconds
+
+    def update(self, headers: httpx.Headers) -> None:
+        """Update the state from response headers, ignoring missing values."""
+
+        if "X-RateLimit-Limit" in headers:
+            self.limit = int(headers["X-RateLimit-Limit"])
+        if "X-RateLimit-Remaining" in headers:
+            self.remaining = int(headers["X-RateLimit-Remaining"])
+        if "X-RateLimit-Reset" in headers:
+            self.reset_at = float(headers["X-RateLimit-Reset"])
+
+    def sustainable_rate(self) -> float:
+        """Requests per second that spread the remaining budget until the reset."""
+
+        seconds_left = max(self.reset_at - time.time(), 1.0)
+        return self.remaining / seconds_left
+
+
+class TokenBucket:
+    """Pace callers to `rate` requests per second, allowing bursts of `capacity`."""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated_at
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated_at = now
+
+    def delay(self) -> float:
+        """Seconds until a token is available, 0 if one is."""
+
+        self._refill()
+        return max(1 - self._tokens, 0) / self.rate
+
+    def take(self) -> None:
+        """Take a token, even if that leaves the bucket in debt."""
+
+        self._refill()
+        self._tokens -= 1
+
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it."""
+
+        async with self._lock:
+            while (delay := self.delay()) > 0:
+                await asyncio.sleep(delay)
+            self.take()
+
+
+def load_tokens() -> list[str]:
+    """Read the GitHub tokens to crawl with from the environment.
+
+    Tokens are taken from `GITHUB_TOKEN`, `GITHUB_TOKEN_1`, `GITHUB_TOKEN_2`, ...,
+    the comma separated `GITHUB_TOKENS`, and the file named by
+    `GITHUB_TOKENS_FILE` with one token per line, without duplicates.
+    """
+
+    tokens = [os.getenv("GITHUB_TOKEN")]
+    i = 1
+    while f"GITHUB_TOKEN_{i}" in os.environ:
+        tokens.append(os.environ[f"GITHUB_TOKEN_{i}"])
+        i += 1
+    tokens.extend(os.getenv("GITHUB_TOKENS", "").split(","))
+    if "GITHUB_TOKENS_FILE" in os.environ:
+        with open(os.environ["GITHUB_TOKENS_FILE"]) as f:
+            tokens.extend(f.read().splitlines())
+
+    tokens = list(dict.fromkeys(t.strip() for t in tokens if t and t.strip()))
+    if not tokens:
+        raise KeyError("No GitHub token found, set GITHUB_TOKEN, see sample.env")
+    return tokens
+
+
+class PooledToken:
+    """A GitHub token with its own rate limit state and request pacing."""
+
+    def __init__(self, value: str, max_rate: float, capacity: float) -> None:
+        self.value = value
+        self.rate_limit = RateLimit()
+        self.bucket = TokenBucket(rate=max_rate, capacity=capacity)
+        self.resume_at = 0.0  # Unix epoch seconds, parked until then
+        self.in_flight = 0  # Requests sent, or about to be, without a response yet
+
+    def __repr__(self) -> str:
+        return (
+            f"PooledToken(...{self.value[-4:]}, remaining={self.rate_limit.remaining})"
+        )
+
+    @property
+    def budget(self) -> int:
+        """Requests left until the reset, not counting those in flight."""
+
+        remaining = self.rate_limit.remaining
+        if self.rate_limit.reset_at <= time.time():
+            remaining = self.rate_limit.limit  # The budget starts over
+        return remaining - self.in_flight
+
+
+class TokenPool:
+    """Tokens to spread requests over, so their rate limits add up.
+
+    Each request goes to the token whose pacing lets it through the soonest,
+    the one with the most budget left among those ready. Requests in flight
+    count against the budget of their token, and a token that hits its limit
+    is parked until its reset time.
+    """
+
+    def __init__(
+        self, tokens: list[str], max_rate: float = 10.0, capacity: float = 8
+    ) -> None:
+        self.tokens = [PooledToken(token, max_rate, capacity) for token in tokens]
+        self._released = asyncio.Event()
+
+    async def acquire(self) -> PooledToken:
+        """Wait for a token to be available and take a request slot from it.
+
+        Call `release` with the token once its response is observed.
+        """
+
+        while True:
+            now = time.time()
+            ready = [t for t in self.tokens if t.resume_at <= now and t.budget > 0]
+            if ready:
+                token = min(ready, key=lambda t: (t.bucket.delay(), -t.budget))
+                timeout = token.bucket.delay()
+                if timeout <= 0:
+                    token.bucket.take()
+                    token.in_flight += 1
+                    return token
+            else:
+                # Wait for a parked token or a reset, or for requests in flight
+                # to return budget
+                waits = [t.resume_at - now for t in self.tokens if t.resume_at > now]
+                waits += [
+                    t.rate_limit.reset_at - now
+                    for t in self.tokens
+                    if t.budget <= 0 and not t.in_flight
+                ]
+                timeout = min(waits, default=None)
+
+            # Choose again afterwards, another token may be ready sooner by then
+            self._released.clear()
+            try:
+                await asyncio.wait_for(self._released.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self, token: PooledToken) -> None:
+        """Return the request slot of a token taken with `acquire`."""
+
+        token.in_flight -= 1
+        self._released.set()
+
+
+class GraphQLClient:
+    """Asynchronous GitHub GraphQL client that paces requests within the rate limit.
+
+    Requests are spread over a pool of tokens (see `load_tokens`), each paced
+    by a token bucket capped at `max_rate`. Once the remaining budget reported
+    by GitHub for a token drops below the `reserve` fraction of its limit, its
+    rate follows what is left until the reset, so many requests can be in
+    flight at once without exhausting the hourly quota. `Retry-After` and
+    exhausted budgets park the token until GitHub allows it again.
+
+    Responses are served from and saved to `cache` if given, by default the
+    one configured in the environment (see `ResponseCache.from_env`), none
+    with `cache=False`. Responses with GraphQL `errors` are not saved, they
+    are often transient. With an offline cache no token is needed.
+
+    Use as an async context manager:
+
+        async with GraphQLClient() as client:
+            data = await client.query(query)
+    """
+
+    def __init__(
+        self,
+        token: str | None = None,
+        url: str = GITHUB_GRAPHQL_URL,
+        max_concurrency: int = 8,
+        max_rate: float = 10.0,
+        min_rate: float = 0.1,
+        reserve: float = 0.1,
+        timeout: float = 60.0,
+        tokens: list[str] | None = None,
+        cache: ResponseCache | bool | None = None,
+    ) -> None:
+        if cache is None or cache is True:
+            cache = ResponseCache.from_env()
+        elif cache is False:
+            cache = None
+        if tokens is None:
+            if token:
+                tokens = [token]
+            elif cache is not None and cache.offline:
+                tokens = []
+            else:
+                tokens = load_tokens()
+        self.url = url
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.reserve = reserve
+        self.timeout = timeout
+        self.pool = TokenPool(tokens, max_rate=max_rate, capacity=max_concurrency)
+        self.cache = cache
+        self.pages = 0  # Number of successful requests
+
+        self._max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._http: httpx.AsyncClient | None = None
+
+    async def __aenter__(self) -> "GraphQLClient":
+        self._http = make_async_client(
+            timeout=self.timeout, max_connections=self._max_concurrency
+        )
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Close the underlying HTTP connections."""
+
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    @staticmethod
+    def _park(token: PooledToken, resume_at: float) -> None:
+        """Hold back all requests with `token` until `resume_at`."""
+
+        if resume_at > token.resume_at:
+            logging.warning(
+                f"Rate limited, parking {token} for"
+                f" {resume_at - time.time():.0f} seconds"
+            )
+            token.resume_at = resume_at
+
+    def _observe(self, token: PooledToken, response: httpx.Response) -> None:
+        """Adapt the pacing of a token to the rate limit state in the response."""
+
+        token.rate_limit.update(response.headers)
+
+        # Run at full speed while the budget is healthy, then spread the rest
+        # of it evenly until the reset so we never hit zero. An exhausted token
+        # is parked instead, and starts over at full speed with a new budget.
+        rate = self.max_rate
+        remaining = token.rate_limit.remaining
+        if 0 < remaining < self.reserve * token.rate_limit.limit:
+            rate = min(rate, token.rate_limit.sustainable_rate())
+        token.bucket.rate = max(rate, self.min_rate)
+
+        if "Retry-After" in response.headers:
+            self._park(token, time.time() + float(response.headers["Retry-After"]))
+        elif remaining == 0:
+            self._park(token, token.rate_limit.reset_at)
+
+    @staticmethod
+    def _is_rate_limited(response: httpx.Response) -> bool:
+        if response.status_code == 429:
+            return True
+        if response.status_code == 403:
+            return (
+                "Retry-After" in response.headers
+                or response.headers.get("X-RateLimit-Remaining") == "0"
+                or "rate limit" in response.text.lower()
+            )
+        return False
+
+    async def query(self, query: str, variables: dict | None = None) -> dict:
+        """Post a GraphQL query to the GitHub API, unless its response is cached."""
+
+        if self.cache is not None:
+            data = self.cache.get(query, variables)
+            if data is not None:
+                return data
+
+        data = await self._post(query, variables)
+        if self.cache is not None and not data.get("errors"):
+            self.cache.put(query, data, variables)
+        return data
+
+    @tenacity.retry(
+        stop=tenacity.stop_after_attempt(5),
+        wait=tenacity.wait_exponential(min=2, max=30),
+    )
+    async def _post(self, query: str, variables: dict | None = None) -> dict:
+        if self._http is None:
+            raise RuntimeError("GraphQLClient must be used as an async context manager")
+
+        payload = {"query": query}
+        if variables:
+            payload["variables"] = variables
+        token = await self.pool.acquire()
+        try:
+            async with self._semaphore:
+                response = await self._http.post(
+                    self.url,
+                    headers={"Authorization": f"Bearer {token.value}"},
+                    json=payload,
+                )
+            self._observe(token, response)
+        finally:
+            self.pool.release(token)
+
+        if self._is_rate_limited(response):
+            if "Retry-After" not in response.headers and token.rate_limit.remaining:
+                # Secondary limit without guidance, back off for a minute
+                self._park(token, time.time() + 60)
+            raise RateLimitExceeded(response.text)
+        response.raise_for_status()
+
+        data = response.json()
+        errors = data.get("errors") or []
+        if any(error.get("type") == "RATE_LIMITED" for error in errors):
+            self._park(token, token.rate_limit.reset_at)
+            raise RateLimitExceeded(str(errors))
+
+        self.pages += 1
+        return data
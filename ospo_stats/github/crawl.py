@@ -1,227 +1,1312 @@
-import json
+import argparse
+import asyncio
 import logging
+import math
 import os
-from datetime import datetime
+import socket
+import time
+from datetime import date, datetime, timedelta, timezone
+from functools import partial
+from itertools import takewhile
 from pathlib import Path
-from time import sleep
+from typing import Any, AsyncIterator, Awaitable, Callable, Coroutine, TypeVar
 
-import requests
-import tenacity
+import pyarrow as pa
 from dotenv import load_dotenv
-from sqlalchemy import text
+from sqlalchemy import func, text
 from sqlalchemy.orm import Session
 from tqdm import tqdm
 
-from ospo_stats.db import ENGINE, Commit, Repo, Stargazer, push
+from ospo_stats.db import (
+    ENGINE,
+    Commit,
+    Repo,
+    RepoTerm,
+    Stargazer,
+    add_missing_columns,
+    create_missing_indexes,
+    create_missing_tables,
+    push,
+    push_batch,
+)
+from ospo_stats.github.archive import RawArchive
+from ospo_stats.github.checkpoint import (
+    DEFAULT_CHECKPOINT_PATH,
+    Checkpoint,
+    CheckpointStore,
+)
+from ospo_stats.github.client import GraphQLClient
 from ospo_stats.github.parser import (
+    commits_to_batch,
     get_owner_and_repo_name,
-    parse_commits,
-    parse_discover_response,
-    parse_stargazers,
+    get_readme_blob,
+    has_image,
+    repos_to_batch,
+    stargazers_to_batch,
 )
+from ospo_stats.github.planner import get_repo_states, plan_refresh
 from ospo_stats.github.query import (
+    get_batch_alias,
+    get_commits_batch_query,
     get_commits_query,
+    get_readme_batch_query,
+    get_repo_batch_query,
     get_repo_discovery_query,
+    get_stargazers_batch_query,
     get_stargazers_query,
 )
+from ospo_stats.github.workqueue import LeaseLost, Task, WorkQueue
+from ospo_stats.http_client import STATS
 
 load_dotenv()
 
 YEAR_NOW = datetime.now().year
+SEARCH_RESULT_LIMIT = 1000  # GitHub search returns at most this many results
+PUSH_CHUNK_SIZE = 1000  # Rows parsed and pushed at once when streaming pages
+README_BATCH_SIZE = 50  # Repos per README request
+REPO_BATCH_SIZE = 50  # Repos per request for the repos a search found the urls of
 
+T = TypeVar("T")
 
-@tenacity.retry(
-    stop=tenacity.stop_after_attempt(5),
-    wait=tenacity.wait_exponential(min=2, max=30),
-)
-def query_graphql(query: str) -> dict:
-    """Post a GraphQL query to the GitHub API."""
-    response = requests.post(
-        "https://api.github.com/graphql",
-        headers={"Authorization": f"Bearer {os.environ['GITHUB_TOKEN']}"},
-        json={"query": query},
+
+async def gather_or_cancel(*aws: Awaitable) -> list:
+    """Like `asyncio.gather`, but cancel the other awaitables when one fails.
+
+    This way a failed crawl does not leave pages being fetched and pushed in
+    the background.
+    """
+
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+def run_sync(main: Coroutine[Any, Any, T], async_name: str) -> T:
+    """Run a crawl coroutine from synchronous code, like `asyncio.run`.
+
+    In a running event loop, like Jupyter's, `asyncio.run` cannot be used:
+    the error points to the `async_name` coroutine to await instead.
+    """
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(main)
+    main.close()
+    raise RuntimeError(
+        f"An event loop is already running, use `await {async_name}(...)` instead"
     )
-    response.raise_for_status()
-    sleep(2)  # Avoid rate limiting
-    return response.json()
 
 
-def discover_yearly(term: str, year: int) -> list[dict]:
-    """Page through the GitHub API to retrieve all repositories matching a keyword."""
+async def discover_window(
+    term: str,
+    start: date,
+    end: date,
+    client: GraphQLClient,
+    urls_only: bool = False,
+    on_page: Callable[[list[dict]], None] | None = None,
+) -> list[dict]:
+    """Retrieve all repositories matching a keyword created between two dates.
+
+    GitHub search returns at most 1000 results, so a window with more matches
+    is split into smaller windows, searched concurrently, down to single days.
+    With `urls_only`, nothing but the url of the repositories is fetched.
+    `on_page` is called with each page of results as it comes, to save it
+    right away.
+    """
+
+    query = get_repo_discovery_query(
+        term=term,
+        start=start,
+        end=end,
+        urls_only=urls_only,
+    )
+    data = await client.query(query)
+    total = data["data"]["search"]["repositoryCount"]
+
+    days = (end - start).days + 1
+    if total > SEARCH_RESULT_LIMIT and days > 1:
+        n_windows = min(days, max(2, math.ceil(total / SEARCH_RESULT_LIMIT)))
+        starts = [
+            start + timedelta(days=days * i // n_windows) for i in range(n_windows)
+        ]
+        ends = [next_start - timedelta(days=1) for next_start in starts[1:]] + [end]
+        logging.info(f"{total} repos created {start}..{end}, splitting in {n_windows}")
+        windows = await gather_or_cancel(
+            *(
+                discover_window(term, *window, client, urls_only, on_page)
+                for window in zip(starts, ends)
+            )
+        )
+        return [repo for window in windows for repo in window]
+
+    if total > SEARCH_RESULT_LIMIT:
+        logging.warning(
+            f"{total} repos created on {start}, only {SEARCH_RESULT_LIMIT} are found"
+        )
 
-    # To avoid hitting 1000 max results, we need to page through years
     repos = []
-    after_cursor = None
     while True:
-        query = get_repo_discovery_query(term=term, year=year, after=after_cursor)
-        data = query_graphql(query)
-
-        total = data["data"]["search"]["repositoryCount"]
-        repos.extend(data["data"]["search"]["repos"])
-        logging.info(f"Obtained repos: {len(repos)} / {total}")
+        page = data["data"]["search"]["repos"]
+        repos.extend(page)
+        if on_page is not None:
+            on_page(page)
+        logging.info(f"Obtained repos: {len(repos)} / {total} ({start}..{end})")
 
         # Handle pagination
         has_next = data["data"]["search"]["pageInfo"]["hasNextPage"]
         if not has_next:
             break
         after_cursor = data["data"]["search"]["pageInfo"]["endCursor"]
+        query = get_repo_discovery_query(
+            term=term,
+            start=start,
+            end=end,
+            after=after_cursor,
+            urls_only=urls_only,
+        )
+        data = await client.query(query)
     return repos
 
 
-def get_stargazers(owner: str, name: str) -> list[dict]:
-    """Get the stargazers of a repository."""
+async def discover_yearly(
+    term: str,
+    year: int,
+    client: GraphQLClient | None = None,
+    on_page: Callable[[list[dict]], None] | None = None,
+) -> list[dict]:
+    """Page through the GitHub API to retrieve all repositories matching a keyword."""
+
+    if client is None:
+        async with GraphQLClient() as client:
+            return await discover_yearly(term, year, client, on_page)
+
+    # To avoid hitting 1000 max results, we page through years, and
+    # smaller windows within the busier years
+    return await discover_window(
+        term,
+        date(year, 1, 1),
+        date(year, 12, 31),
+        client,
+        on_page=on_page,
+    )
 
-    stargazers = []
-    after_cursor = None
+
+async def fetch_repos(
+    urls: list[str],
+    client: GraphQLClient,
+    batch_size: int = REPO_BATCH_SIZE,
+) -> list[dict]:
+    """Fetch the discovery fields of repositories, many per request.
+
+    Returns them in the shape of search results, leaving out the repositories
+    that could not be resolved.
+    """
+
+    async def fetch_batch(batch: list[str]) -> list[dict]:
+        query = get_repo_batch_query([get_owner_and_repo_name(url) for url in batch])
+        data = await client.query(query)
+        repos = [data["data"][get_batch_alias(i)] for i in range(len(batch))]
+        return [{"repo": repo} for repo in repos if repo is not None]
+
+    batches = await gather_or_cancel(
+        *(
+            fetch_batch(urls[i : i + batch_size])
+            for i in range(0, len(urls), batch_size)
+        )
+    )
+    return [repo for batch in batches for repo in batch]
+
+
+async def discover_unseen(
+    term: str,
+    year: int,
+    client: GraphQLClient,
+    seen: set[str],
+    on_page: Callable[[list[dict]], None] | None = None,
+) -> list[dict]:
+    """Discover the repositories of a year, fetching the unseen ones in full only.
+
+    Once other terms found repositories, the search only fetches urls, and
+    the fields of the repositories not in `seen` are fetched in batches.
+    The `seen` ones are returned with their url only, which tells that the
+    term matched them. `on_page` is called with the results as they come.
+    """
+
+    if not seen:
+        return await discover_yearly(term, year, client, on_page)
+
+    found = await discover_window(
+        term, date(year, 1, 1), date(year, 12, 31), client, urls_only=True
+    )
+    urls = [repo["repo"]["url"] for repo in found]
+    new_urls = [url for url in urls if url not in seen]
+    logging.info(f"{len(new_urls)} / {len(urls)} repos of {term} in {year} are new")
+    repos = await fetch_repos(new_urls, client)
+    repos += [{"repo": {"url": url}} for url in urls if url in seen]
+    if on_page is not None:
+        on_page(repos)
+    return repos
+
+
+async def iter_stargazer_pages(
+    owner: str,
+    name: str,
+    client: GraphQLClient,
+    known_users: set[str] | None = None,
+    after: str | None = None,
+) -> AsyncIterator[tuple[list[dict], str | None]]:
+    """Yield (edges, end cursor) for each page of stargazers of a repository.
+
+    Paging starts after the `after` cursor if given. With `known_users`,
+    stargazers are fetched newest first and paging stops at the first one
+    already known, so a refresh only costs the new stars.
+    """
+
+    refresh = known_users is not None
+    n_stargazers = 0
     while True:
-        query = get_stargazers_query(owner=owner, name=name, after=after_cursor)
-        data = query_graphql(query)
+        query = get_stargazers_query(
+            owner=owner, name=name, after=after, newest_first=refresh
+        )
+        data = await client.query(query)
 
         total = data["data"]["repository"]["stargazers"]["totalCount"]
-        stargazers.extend(data["data"]["repository"]["stargazers"]["edges"])
-        logging.info(f"Obtained stargazers: {len(stargazers)} / {total}")
+        edges = data["data"]["repository"]["stargazers"]["edges"]
+        page_info = data["data"]["repository"]["stargazers"]["pageInfo"]
+        reached_known = False
+        if refresh:
+            # Newest first, so every star after the first known one is known too
+            new_edges = list(
+                takewhile(lambda edge: edge["node"]["login"] not in known_users, edges)
+            )
+            reached_known = len(new_edges) < len(edges)
+            edges = new_edges
+        n_stargazers += len(edges)
+        logging.info(f"Obtained stargazers: {n_stargazers} / {total}")
+        yield edges, page_info["endCursor"]
 
         # Handle pagination
-        has_next = data["data"]["repository"]["stargazers"]["pageInfo"]["hasNextPage"]
-        if not has_next:
+        if reached_known or not page_info["hasNextPage"]:
             break
-        after_cursor = data["data"]["repository"]["stargazers"]["pageInfo"]["endCursor"]
+        after = page_info["endCursor"]
+
+
+async def get_stargazers(
+    owner: str,
+    name: str,
+    client: GraphQLClient | None = None,
+    known_users: set[str] | None = None,
+) -> list[dict]:
+    """Get the stargazers of a repository.
+
+    With `known_users`, only the stars newer than the known ones are fetched,
+    see `iter_stargazer_pages`.
+    """
+
+    if client is None:
+        async with GraphQLClient() as client:
+            return await get_stargazers(owner, name, client, known_users)
+
+    stargazers = []
+    async for edges, _ in iter_stargazer_pages(owner, name, client, known_users):
+        stargazers.extend(edges)
     return stargazers
 
 
-def get_commits(owner: str, name: str) -> list[dict]:
-    """Get the commits of a repository."""
+async def iter_commit_pages(
+    owner: str,
+    name: str,
+    client: GraphQLClient,
+    since: datetime | None = None,
+    after: str | None = None,
+) -> AsyncIterator[tuple[list[dict], str | None]]:
+    """Yield (edges, end cursor) for each page of commits of a repository.
 
-    commits = []
-    after_cursor = None
+    Paging starts after the `after` cursor if given. With `since`, only commits
+    from then on are included.
+    """
 
+    n_commits = 0
     while True:
-        query = get_commits_query(owner=owner, name=name, after=after_cursor)
-        data = query_graphql(query)
+        query = get_commits_query(owner=owner, name=name, after=after, since=since)
+        data = await client.query(query)
 
-        total = data["data"]["repository"]["defaultBranchRef"]["target"]["history"][
-            "totalCount"
-        ]
-        commits.extend(
-            data["data"]["repository"]["defaultBranchRef"]["target"]["history"]["edges"]
-        )
-        logging.info(f"Obtained commits: {len(commits)} / {total}")
+        history = data["data"]["repository"]["defaultBranchRef"]["target"]["history"]
+        n_commits += len(history["edges"])
+        logging.info(f"Obtained commits: {n_commits} / {history['totalCount']}")
+        yield history["edges"], history["pageInfo"]["endCursor"]
 
         # Handle pagination
-        has_next = data["data"]["repository"]["defaultBranchRef"]["target"]["history"][
-            "pageInfo"
-        ]["hasNextPage"]
-        if not has_next:
+        if not history["pageInfo"]["hasNextPage"]:
             break
-        after_cursor = data["data"]["repository"]["defaultBranchRef"]["target"][
-            "history"
-        ]["pageInfo"]["endCursor"]
+        after = history["pageInfo"]["endCursor"]
+
+
+async def get_commits(
+    owner: str,
+    name: str,
+    client: GraphQLClient | None = None,
+    since: datetime | None = None,
+) -> list[dict]:
+    """Get the commits of a repository, optionally only those from `since` on."""
+
+    if client is None:
+        async with GraphQLClient() as client:
+            return await get_commits(owner, name, client, since)
+
+    commits = []
+    async for edges, _ in iter_commit_pages(owner, name, client, since):
+        commits.extend(edges)
+    return commits
+
+
+def _get_history(repository: dict | None) -> dict | None:
+    """Get the commit history connection of a repository, if it has any."""
+
+    if repository is None or repository["defaultBranchRef"] is None:
+        return None
+    return repository["defaultBranchRef"]["target"]["history"]
+
+
+async def iter_commit_batches(
+    urls: list[str],
+    client: GraphQLClient,
+    since: dict[str, datetime] | None = None,
+) -> AsyncIterator[dict[str, list[dict]]]:
+    """Yield the commit edges of many repositories, one page of each per request.
+
+    Repositories are fetched together under GraphQL aliases, each with its own
+    cursor, and drop out of the batch once they have no more pages. Missing or
+    empty repositories get no commits. `since` maps a url to the time from
+    which to fetch its commits.
+    """
+
+    since = since or {}
+    cursors: dict[str, str | None] = dict.fromkeys(urls)  # Repos with more pages
+
+    while cursors:
+        pending = list(cursors)
+        query = get_commits_batch_query(
+            repos=[get_owner_and_repo_name(url) for url in pending],
+            afters=[cursors[url] for url in pending],
+            since=[since.get(url) for url in pending],
+        )
+        data = await client.query(query)
+
+        commits = {}
+        for i, url in enumerate(pending):
+            history = _get_history(data["data"][get_batch_alias(i)])
+            if history is None:
+                logging.info(f"{url} has no commit history")
+                del cursors[url]
+                continue
+
+            commits[url] = history["edges"]
+            if history["pageInfo"]["hasNextPage"]:
+                cursors[url] = history["pageInfo"]["endCursor"]
+            else:
+                del cursors[url]
+        logging.info(f"Obtained commits of {len(urls) - len(cursors)} / {len(urls)}")
+        yield commits
+
+
+async def get_commits_batch(
+    urls: list[str],
+    client: GraphQLClient,
+    since: dict[str, datetime] | None = None,
+) -> dict[str, list[dict]]:
+    """Get the commits of many repositories, see `iter_commit_batches`."""
+
+    commits = {url: [] for url in urls}
+    async for batch in iter_commit_batches(urls, client, since):
+        for url, edges in batch.items():
+            commits[url].extend(edges)
     return commits
 
 
-def discover_repos(
+async def iter_stargazer_batches(
+    urls: list[str],
+    client: GraphQLClient,
+    known_users: dict[str, set[str]] | None = None,
+) -> AsyncIterator[dict[str, list[dict]]]:
+    """Yield the stargazer edges of many repositories, one page of each per request.
+
+    Repositories are paged like in `iter_commit_batches`. With `known_users`,
+    stargazers are fetched newest first and each repository stops at its
+    first known user, like `get_stargazers` does.
+    """
+
+    refresh = known_users is not None
+    known_users = known_users or {}
+    cursors: dict[str, str | None] = dict.fromkeys(urls)  # Repos with more pages
+
+    while cursors:
+        pending = list(cursors)
+        query = get_stargazers_batch_query(
+            repos=[get_owner_and_repo_name(url) for url in pending],
+            afters=[cursors[url] for url in pending],
+            newest_first=refresh,
+        )
+        data = await client.query(query)
+
+        stargazers = {}
+        for i, url in enumerate(pending):
+            repository = data["data"][get_batch_alias(i)]
+            if repository is None:
+                logging.info(f"{url} could not be resolved")
+                del cursors[url]
+                continue
+
+            edges = repository["stargazers"]["edges"]
+            known = known_users.get(url, set())
+            new_edges = list(
+                takewhile(lambda edge: edge["node"]["login"] not in known, edges)
+            )
+            stargazers[url] = new_edges
+
+            page_info = repository["stargazers"]["pageInfo"]
+            if len(new_edges) == len(edges) and page_info["hasNextPage"]:
+                cursors[url] = page_info["endCursor"]
+            else:
+                del cursors[url]
+        logging.info(f"Obtained stargazers of {len(urls) - len(cursors)} / {len(urls)}")
+        yield stargazers
+
+
+async def get_stargazers_batch(
+    urls: list[str],
+    client: GraphQLClient,
+    known_users: dict[str, set[str]] | None = None,
+) -> dict[str, list[dict]]:
+    """Get the stargazers of many repositories, see `iter_stargazer_batches`."""
+
+    stargazers = {url: [] for url in urls}
+    async for batch in iter_stargazer_batches(urls, client, known_users):
+        for url, edges in batch.items():
+            stargazers[url].extend(edges)
+    return stargazers
+
+
+def _push_discovered(term: str, year: int, repos: list[dict]) -> None:
+    """Push the repos discovered in a year to Turso.
+
+    Repos with their url only are not pushed again, only the term matching
+    them is.
+    """
+
+    if not repos:
+        logging.info(f"No repos found for {term} in {year}")
+        return
+
+    push_batch(Repo, repos_to_batch(repos))
+    urls = [repo["repo"]["url"] for repo in repos]
+    push_batch(
+        RepoTerm,
+        pa.RecordBatch.from_pydict({"repo_url": urls, "term": [term] * len(urls)}),
+    )
+
+
+def _read_discovered_urls(archive: RawArchive, term: str, year: int) -> set[str]:
+    """Get the urls of the repos archived for a term in a year."""
+    return {repo["repo"]["url"] for repo in archive.read_window(term, year)}
+
+
+async def _discover_and_archive(
+    term: str,
+    year: int,
+    client: GraphQLClient,
+    archive: RawArchive,
+    seen: set[str] | None = None,
+) -> list[dict]:
+    """Discover the repos of a year, appending each page to the archive."""
+
+    archive.clear(term, year)  # Pages of an interrupted run
+    on_page = partial(archive.append, term, year)
+    if seen is None:
+        return await discover_yearly(term, year, client, on_page)
+    return await discover_unseen(term, year, client, seen, on_page)
+
+
+async def _discover_years(
     term: str,
+    years: list[int],
+    archive: RawArchive,
+    push_to_turso: bool,
+    checkpoints: CheckpointStore | None,
+    client: GraphQLClient,
+    seen: set[str],
+) -> None:
+    async def discover_and_save(year: int) -> None:
+        key = f"{term}/{year}"
+        checkpoint = checkpoints and checkpoints.get(key, "discover")
+        if checkpoint and checkpoint.done:
+            logging.info(f"Skipping {term} in {year}, already discovered")
+            urls = await asyncio.to_thread(_read_discovered_urls, archive, term, year)
+            seen.update(urls)
+            return
+
+        repos = await _discover_and_archive(term, year, client, archive, seen)
+        if push_to_turso:
+            await asyncio.to_thread(_push_discovered, term, year, repos)
+        seen.update(repo["repo"]["url"] for repo in repos)
+        if checkpoints is not None:
+            checkpoint = Checkpoint(rows=len(repos), done=True)
+            checkpoints.save(key, "discover", checkpoint)
+
+    await gather_or_cancel(*(discover_and_save(year) for year in years))
+
+
+async def discover_repos_async(
+    term: str | list[str],
     year_min: int = 2008,
     year_max: int = YEAR_NOW,
     output_dir: Path | str = "data",
     push_to_turso: bool = True,
+    checkpoints: CheckpointStore | None = None,
 ) -> None:
-    """Crawl github for repositories matching a keyword."""
+    """Crawl github for repositories matching a keyword, or any of many keywords.
 
-    if isinstance(output_dir, str):
-        output_dir = Path(output_dir)
-    output_dir.mkdir(exist_ok=True, parents=True)
+    Await it in a running event loop, like in notebooks, or call
+    `discover_repos` from scripts.
 
-    for year in range(year_min, year_max + 1):
-        logging.info(f"Searching for {year}:")
-        this_year_repos = discover_yearly(term, year)
+    Each page is appended to the `RawArchive` in `output_dir` as soon as it
+    is discovered, and each year is pushed once done. With `checkpoints`, years
+    finished by an earlier, interrupted run are not searched again, and the
+    checkpoints are cleared once every term is discovered. Only metadata is
+    discovered, READMEs are fetched by `update_readmes`.
 
-        if not this_year_repos:
-            logging.info(f"No repos found for {year}")
-            continue
+    Terms are searched one after the other, and a repo is fetched and pushed
+    in full only for the first term that finds it (see `discover_unseen`),
+    so put the broadest term first. The terms matching each repo are pushed
+    to the `repo_term` table.
+    """
 
-        # Save the results locally
-        json_file = output_dir / f"repos_{term}_{year}.json"
-        with open(json_file, "w") as f:
-            f.write(json.dumps(this_year_repos, indent=4))
+    terms = [term] if isinstance(term, str) else term
+    archive = RawArchive(output_dir)
+    if push_to_turso:
+        await asyncio.to_thread(add_missing_columns)
+        await asyncio.to_thread(create_missing_tables)
 
-        if not push_to_turso:
-            continue
+    years = list(range(year_min, year_max + 1))
+    seen: set[str] = set()  # Repos found by the terms searched so far
+    async with GraphQLClient() as client:
+        for term in terms:
+            # Years are searched concurrently, within the rate limit
+            await _discover_years(
+                term,
+                years,
+                archive,
+                push_to_turso,
+                checkpoints,
+                client,
+                seen,
+            )
 
-        # Parse and Push to Turso
-        parsed = [parse_discover_response(repo) for repo in this_year_repos]
-        parsed = [p for p in parsed if p is not None]
-        repos = [Repo(**repo) for repo in parsed]
-        push(repos)
+    # The run is complete, the next one searches every year again
+    if checkpoints is not None:
+        for term in terms:
+            for year in years:
+                checkpoints.clear(f"{term}/{year}", "discover")
 
 
-def crawl_commits(url: str) -> list[Commit]:
-    owner, repo = get_owner_and_repo_name(url)
-    raw_commits = get_commits(owner, repo)
+def discover_repos(*args, **kwargs) -> None:
+    """Run `discover_repos_async` to completion, outside of an event loop."""
 
-    commits = []
-    for commit in raw_commits:
-        parsed = parse_commits(commit)
-        parsed["repo_url"] = url
-        commits.append(Commit(**parsed))
-    return commits
+    run_sync(discover_repos_async(*args, **kwargs), "discover_repos_async")
 
 
-def crawl_stargazers(url: str) -> list[Stargazer]:
-    owner, repo = get_owner_and_repo_name(url)
-    raw_stargazers = get_stargazers(owner, repo)
+async def fetch_readmes(
+    known_oids: dict[str, str | None],
+    client: GraphQLClient,
+    batch_size: int = README_BATCH_SIZE,
+) -> dict[str, dict]:
+    """Fetch the README of the repositories whose README changed.
 
-    stargazers = []
-    for stargazer in raw_stargazers:
-        parsed = parse_stargazers(stargazer)
-        parsed["repo_url"] = url
-        parsed["id"] = f"{url}/{parsed['user']}"
-        stargazers.append(Stargazer(**parsed))
-    return stargazers
+    For each batch of repositories, the blob ids of their READMEs are probed
+    first, and the text is only fetched for those that differ from the known
+    blob id of their url. Returns the `Repo` README fields by url, repos
+    without a (text) README are left out.
+    """
+
+    async def fetch_batch(urls: list[str]) -> dict[str, dict]:
+        query = get_readme_batch_query([get_owner_and_repo_name(url) for url in urls])
+        data = await client.query(query)
+        changed = []
+        for i, url in enumerate(urls):
+            readme = get_readme_blob(data["data"][get_batch_alias(i)] or {})
+            if readme is not None and readme["oid"] != known_oids[url]:
+                changed.append(url)
+        if not changed:
+            return {}
+
+        query = get_readme_batch_query(
+            [get_owner_and_repo_name(url) for url in changed], text=True
+        )
+        data = await client.query(query)
+        readmes = {}
+        for i, url in enumerate(changed):
+            readme = get_readme_blob(data["data"][get_batch_alias(i)] or {})
+            if readme is None or readme["text"] is None:  # Removed, or binary
+                continue
+            readmes[url] = {
+                "readme": readme["text"],
+                "readme_has_image": has_image(readme["text"]),
+                "readme_oid": readme["oid"],
+            }
+        return readmes
+
+    urls = list(known_oids)
+    batches = await gather_or_cancel(
+        *(
+            fetch_batch(urls[i : i + batch_size])
+            for i in range(0, len(urls), batch_size)
+        )
+    )
+    return {url: readme for batch in batches for url, readme in batch.items()}
+
+
+async def update_readmes_async(
+    uncategorized_only: bool = False, batch_size: int = README_BATCH_SIZE
+) -> None:
+    """Fetch the README of the repos in the database, skipping unchanged ones.
+
+    With `uncategorized_only`, only the repos that still need a category get
+    their README, since it is what they are categorized from. Await it in a
+    running event loop, or call `update_readmes` from scripts.
+    """
+
+    def get_known_oids() -> dict[str, str | None]:
+        add_missing_columns()
+        with Session(ENGINE) as session:
+            query = session.query(Repo.url, Repo.readme_oid)
+            if uncategorized_only:
+                query = query.filter(Repo.category.is_(None))
+            return {url: readme_oid for url, readme_oid in query}
+
+    known_oids = await asyncio.to_thread(get_known_oids)
+    async with GraphQLClient() as client:
+        readmes = await fetch_readmes(known_oids, client, batch_size)
+    logging.info(f"{len(readmes)} / {len(known_oids)} READMEs changed")
+    await asyncio.to_thread(
+        push, [Repo(url=url, **readme) for url, readme in readmes.items()]
+    )
+
+
+def update_readmes(*args, **kwargs) -> None:
+    """Run `update_readmes_async` to completion, outside of an event loop."""
+
+    run_sync(update_readmes_async(*args, **kwargs), "update_readmes_async")
 
 
 def check_repo_in_table(repo_url: str, table: str) -> bool:
-    """Check if a repo is already in the table."""
+    """Check if a repo is already in the table.
+
+    To check many repos, load them at once with `get_crawled_repos` instead.
+    """
+    if table not in (Commit.__tablename__, Stargazer.__tablename__):
+        raise ValueError(f"Unknown history table: {table}")
     with Session(ENGINE) as session:
         result = session.execute(
-            text(f'SELECT repo_url FROM {table} WHERE repo_url = "{repo_url}" LIMIT 1')
+            text(f"SELECT 1 FROM {table} WHERE repo_url = :repo_url LIMIT 1"),
+            {"repo_url": repo_url},
+        )
+        return result.first() is not None
+
+
+def get_crawled_repos() -> set[str]:
+    """Get the url of every repo with a commit history, in one query."""
+    with Session(ENGINE) as session:
+        query = session.query(Commit.repo_url).distinct()
+        return {repo_url for (repo_url,) in query}
+
+
+def get_last_commit_times() -> dict[str, datetime]:
+    """Get the latest known commit time of every crawled repo."""
+    with Session(ENGINE) as session:
+        query = session.query(Commit.repo_url, func.max(Commit.committed_at)).group_by(
+            Commit.repo_url
+        )
+        return {repo_url: committed_at for repo_url, committed_at in query}
+
+
+def get_known_stargazers(repo_url: str) -> set[str]:
+    """Get the users already recorded as stargazers of a repo."""
+    with Session(ENGINE) as session:
+        query = session.query(Stargazer.user).filter(Stargazer.repo_url == repo_url)
+        return {user for (user,) in query}
+
+
+# Table and record batch builder of each kind of history, by kind
+_HISTORY_BATCHES = {
+    "commits": (Commit, commits_to_batch),
+    "stargazers": (Stargazer, stargazers_to_batch),
+}
+
+
+def mark_history_crawled(repo_urls: list[str]) -> None:
+    """Record that the history of repos was just crawled, see `plan_refresh`."""
+
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    push([Repo(url=url, history_crawled_at=now) for url in repo_urls])
+
+
+async def iter_chunks(
+    pages: AsyncIterator[tuple[list[dict], str | None]], chunk_size: int
+) -> AsyncIterator[tuple[list[dict], str | None]]:
+    """Regroup pages into chunks of at least `chunk_size` edges.
+
+    Chunks are made of whole pages, so the cursor after the last page of a
+    chunk, yielded with it, marks exactly where the chunk ends.
+    """
+
+    chunk = []
+    cursor = None
+    async for edges, cursor in pages:
+        chunk.extend(edges)
+        if len(chunk) >= chunk_size:
+            yield chunk, cursor
+            chunk = []
+    if chunk:
+        yield chunk, cursor
+
+
+async def _push_pages(
+    url: str,
+    kind: str,
+    pages: AsyncIterator[tuple[list[dict], str | None]],
+    checkpoint: Checkpoint,
+    checkpoints: CheckpointStore | None = None,
+    chunk_size: int = PUSH_CHUNK_SIZE,
+) -> None:
+    """Parse and push pages in chunks as they arrive, checkpointing after each.
+
+    Chunks are parsed straight into Arrow record batches of the table of
+    `kind`, and upserted in bulk.
+    """
+
+    if checkpoint.done:
+        return
+
+    model, to_batch = _HISTORY_BATCHES[kind]
+    async for edges, cursor in iter_chunks(pages, chunk_size):
+        batch = to_batch({url: edges})
+        await asyncio.to_thread(push_batch, model, batch)
+        checkpoint.cursor = cursor
+        checkpoint.rows += batch.num_rows
+        if checkpoints is not None:
+            checkpoints.save(url, kind, checkpoint)
+
+    checkpoint.done = True
+    if checkpoints is not None:
+        checkpoints.save(url, kind, checkpoint)
+
+
+async def _crawl_pages(
+    repo_url: str,
+    kind: str,
+    checkpoint: Checkpoint,
+    client: GraphQLClient,
+    checkpoints: CheckpointStore | None = None,
+    chunk_size: int = PUSH_CHUNK_SIZE,
+) -> None:
+    """Crawl the "commits" or "stargazers" of a repo with its checkpoint options.
+
+    Commit checkpoints have a `since` ISO time param, stargazer checkpoints a
+    `newest_first` param to only fetch stars newer than the known ones.
+    """
+
+    if checkpoint.done:
+        return
+
+    owner, name = get_owner_and_repo_name(repo_url)
+    if kind == "commits":
+        since = None
+        if checkpoint.params.get("since"):
+            since = datetime.fromisoformat(checkpoint.params["since"])
+        pages = iter_commit_pages(owner, name, client, since, after=checkpoint.cursor)
+    elif kind == "stargazers":
+        known_users = None
+        if checkpoint.params.get("newest_first"):
+            known_users = await asyncio.to_thread(get_known_stargazers, repo_url)
+        pages = iter_stargazer_pages(
+            owner, name, client, known_users, after=checkpoint.cursor
         )
-        return bool(result.fetchall())
+    else:
+        raise ValueError(f"Unknown history kind: {kind}")
+
+    await _push_pages(repo_url, kind, pages, checkpoint, checkpoints, chunk_size)
+
+
+async def crawl_history(
+    repo_url: str,
+    client: GraphQLClient,
+    skip_existing: bool = True,
+    since: datetime | None = None,
+    refresh_stargazers: bool = False,
+    checkpoints: CheckpointStore | None = None,
+    chunk_size: int = PUSH_CHUNK_SIZE,
+    crawled: set[str] | None = None,
+) -> None:
+    """Crawl the commit history of a repository.
+
+    Pages are parsed and pushed in chunks of about `chunk_size` rows as they
+    arrive, so memory stays bounded however large the repo is.
 
+    With `since`, only commits from then on are fetched, to refresh a repo
+    that was crawled before instead of skipping it. With `refresh_stargazers`,
+    only stars newer than the latest known one are fetched. With `checkpoints`,
+    a crawl that was interrupted resumes after its last pushed chunk. The
+    `crawled` urls of `get_crawled_repos` save a query to check for existing
+    history.
+    """
 
-def crawl_history(repo_url: str, skip_existing: bool = True) -> None:
-    """Crawl the commit history of a repository."""
+    commits = stargazers = None
+    if checkpoints is not None:
+        commits = checkpoints.get(repo_url, "commits")
+        stargazers = checkpoints.get(repo_url, "stargazers")
+    resuming = bool(commits or stargazers)
 
-    if skip_existing and check_repo_in_table(repo_url, "commit_history"):
+    skip = not resuming and since is None and skip_existing
+    if skip and crawled is not None:
+        skip = repo_url in crawled
+    elif skip:
+        skip = await asyncio.to_thread(check_repo_in_table, repo_url, "commit_history")
+    if skip:
         logging.info(f"Skipping {repo_url}")
         return
+    if resuming:
+        logging.info(f"Resuming {repo_url} from its checkpoints")
+
+    # A cursor is only valid with the options of the crawl that made it
+    if commits is None:
+        commits = Checkpoint(params={"since": since and since.isoformat()})
+    if stargazers is None:
+        stargazers = Checkpoint(params={"newest_first": refresh_stargazers})
+
+    # Commits and stargazers are independent, fetch them side by side
+    await gather_or_cancel(
+        _crawl_pages(repo_url, "commits", commits, client, checkpoints, chunk_size),
+        _crawl_pages(
+            repo_url, "stargazers", stargazers, client, checkpoints, chunk_size
+        ),
+    )
+
+    if checkpoints is not None:
+        checkpoints.clear(repo_url, "commits")
+        checkpoints.clear(repo_url, "stargazers")
+    await asyncio.to_thread(mark_history_crawled, [repo_url])
+
+
+async def crawl_history_batch(
+    repo_urls: list[str],
+    client: GraphQLClient,
+    skip_existing: bool = True,
+    since: dict[str, datetime] | None = None,
+    crawled: set[str] | None = None,
+) -> None:
+    """Crawl the history of a batch of repositories with aliased queries.
+
+    This saves round trips on the long tail of small repositories, which
+    mostly fit in a single page. Repos in `since`, mapping a url to its latest
+    known commit, are refreshed like `crawl_history` does. `crawled` is the
+    same as for `crawl_history`.
+    """
+
+    since = since or {}
+
+    def is_crawled(url: str) -> bool:
+        if crawled is not None:
+            return url in crawled
+        return check_repo_in_table(url, "commit_history")
+
+    def _filter_and_load_known() -> tuple[list[str], dict[str, set[str]]]:
+        urls = [
+            url
+            for url in repo_urls
+            if url in since or not (skip_existing and is_crawled(url))
+        ]
+        known_users = {url: get_known_stargazers(url) for url in urls if url in since}
+        return urls, known_users
+
+    urls, known_users = await asyncio.to_thread(_filter_and_load_known)
+    if len(urls) < len(repo_urls):
+        logging.info(f"Skipping {len(repo_urls) - len(urls)} crawled repos")
+    if not urls:
+        return
+
+    async def push_batches(batches: AsyncIterator[dict], kind: str) -> None:
+        model, to_batch = _HISTORY_BATCHES[kind]
+        async for pages in batches:
+            await asyncio.to_thread(push_batch, model, to_batch(pages))
+
+    # Push every round of pages as it arrives, to keep memory bounded
+    await gather_or_cancel(
+        push_batches(iter_commit_batches(urls, client, since), "commits"),
+        push_batches(
+            iter_stargazer_batches(urls, client, known_users or None), "stargazers"
+        ),
+    )
+    await asyncio.to_thread(mark_history_crawled, urls)
+
+
+class Throughput:
+    """Aggregate throughput of a crawl, in repos and API pages per minute."""
+
+    def __init__(self, client: GraphQLClient) -> None:
+        self.client = client
+        self.repos = 0
+        self.failed = 0
+        self._start = time.monotonic()
+        self._start_pages = client.pages
+
+    def per_minute(self) -> dict[str, float]:
+        minutes = max(time.monotonic() - self._start, 1e-9) / 60
+        return {
+            "repos/min": self.repos / minutes,
+            "pages/min": (self.client.pages - self._start_pages) / minutes,
+        }
+
+    def __str__(self) -> str:
+        rates = ", ".join(f"{v:.1f} {k}" for k, v in self.per_minute().items())
+        return f"{self.repos} repos ({self.failed} failed), {rates}"
 
-    commits = crawl_commits(repo_url)
-    stargazers = crawl_stargazers(repo_url)
 
-    push(commits)
-    push(stargazers)
+async def crawl_histories(
+    repos: list[str],
+    workers: int = 8,
+    skip_existing: bool = True,
+    incremental: bool = False,
+    batch_size: int = 1,
+    checkpoints: CheckpointStore | None = None,
+    max_pages: int | None = None,
+) -> Throughput:
+    """Crawl the history of many repositories with a pool of concurrent workers.
 
+    A failing repo is logged and counted, it does not stop the other workers.
+    In incremental mode, repos already in `commit_history` only fetch commits
+    since their latest known one and stars newer than the known ones, instead
+    of being skipped. With `batch_size` > 1, workers crawl that many repos per
+    request using `crawl_history_batch`, falling back to one repo at a time
+    for a batch that fails. With `checkpoints`, single repo crawls resume
+    where an interrupted run stopped, batches of small repos are not
+    checkpointed. With `max_pages`, workers stop taking repos once the crawl
+    used that many API pages.
+    """
 
-def main() -> None:
-    """Crawl data."""
-    # Repo discovery
-    # discover_repos("uw-madison")  # This is a somehow not a subset of "madison"
-    # discover_repos("wisc.edu")
-    # discover_repos("wisconsin")
-    # discover_repos("madison")
+    # Look up what was crawled before once, rather than once per repo
+    last_commit_times = {}
+    if incremental:
+        last_commit_times = await asyncio.to_thread(get_last_commit_times)
+    crawled = None
+    if skip_existing:
+        crawled = set(last_commit_times) or await asyncio.to_thread(get_crawled_repos)
+
+    queue: asyncio.Queue[list[str]] = asyncio.Queue()
+    for i in range(0, len(repos), batch_size):
+        queue.put_nowait(repos[i : i + batch_size])
+
+    # Each worker runs the commit and stargazer crawls of its repo side by side
+    async with GraphQLClient(max_concurrency=2 * workers) as client:
+        throughput = Throughput(client)
+        progress = tqdm(total=len(repos), unit="repo")
+
+        def done(n_repos: int) -> None:
+            throughput.repos += n_repos
+            progress.update(n_repos)
+            progress.set_postfix(
+                {k: f"{v:.1f}" for k, v in throughput.per_minute().items()}
+            )
+
+        async def crawl_one(repo: str) -> None:
+            try:
+                await crawl_history(
+                    repo,
+                    client,
+                    skip_existing=skip_existing,
+                    since=last_commit_times.get(repo),
+                    refresh_stargazers=repo in last_commit_times,
+                    checkpoints=checkpoints,
+                    crawled=crawled,
+                )
+            except Exception as e:
+                throughput.failed += 1
+                logging.error(f"Failed to crawl {repo}: {e}")
+            done(1)
+
+        start_pages = client.pages
+
+        def within_budget() -> bool:
+            return max_pages is None or client.pages - start_pages < max_pages
+
+        async def worker() -> None:
+            while not queue.empty() and within_budget():
+                batch = queue.get_nowait()
+                if len(batch) == 1:
+                    await crawl_one(batch[0])
+                    continue
+
+                try:
+                    await crawl_history_batch(
+                        batch,
+                        client,
+                        skip_existing,
+                        since=last_commit_times,
+                        crawled=crawled,
+                    )
+                    done(len(batch))
+                except Exception as e:
+                    logging.warning(f"Batch failed, crawling one by one: {e}")
+                    for repo in batch:
+                        await crawl_one(repo)
+
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        progress.close()
+
+    logging.info(f"Crawled {throughput}")
+    logging.info(f"HTTP requests:\n{STATS}")
+    return throughput
+
+
+def enqueue_histories(
+    queue: WorkQueue, repos: list[str], since: dict[str, datetime] | None = None
+) -> int:
+    """Queue a commits and a stargazers task for each repo.
+
+    Repos in `since`, mapping a url to its latest known commit, are refreshed
+    like `crawl_history` does. Returns the number of new tasks, counting the
+    done or failed ones queued again.
+    """
+
+    since = since or {}
+    tasks = []
+    for url in repos:
+        last_commit = since.get(url)
+        tasks.append(
+            ("commits", url, {"since": last_commit and last_commit.isoformat()})
+        )
+        tasks.append(("stargazers", url, {"newest_first": url in since}))
+    return queue.add_many(tasks)
+
+
+def enqueue_discovery(
+    queue: WorkQueue,
+    term: str,
+    year_min: int = 2008,
+    year_max: int = YEAR_NOW,
+    output_dir: Path | str = "data",
+) -> int:
+    """Queue a discovery task for each year, see `discover_repos`."""
+
+    tasks = [
+        (
+            "discover",
+            f"{term}/{year}",
+            {"term": term, "year": year, "output_dir": str(output_dir)},
+        )
+        for year in range(year_min, year_max + 1)
+    ]
+    return queue.add_many(tasks)
+
+
+async def run_task(
+    task: Task, client: GraphQLClient, checkpoints: CheckpointStore | None = None
+) -> None:
+    """Crawl what a queued task stands for, pushing the results."""
+
+    if task.kind == "discover":
+        term, year = task.params["term"], task.params["year"]
+        archive = RawArchive(task.params["output_dir"])
+        repos = await _discover_and_archive(term, year, client, archive)
+        await asyncio.to_thread(_push_discovered, term, year, repos)
+        return
+
+    checkpoint = checkpoints and checkpoints.get(task.key, task.kind)
+    if checkpoint is None or checkpoint.params != task.params:
+        checkpoint = Checkpoint(params=task.params)
+    await _crawl_pages(task.key, task.kind, checkpoint, client, checkpoints)
+    if checkpoints is not None:
+        checkpoints.clear(task.key, task.kind)
+    await asyncio.to_thread(mark_history_crawled, [task.key])
+
+
+async def _keep_lease(queue: WorkQueue, task: Task) -> None:
+    """Renew the lease of a task until cancelled."""
+
+    while True:
+        await asyncio.sleep(queue.lease_seconds / 3)
+        if not await asyncio.to_thread(queue.heartbeat, task):
+            raise LeaseLost(f"Lost the lease of {task.kind} {task.key}")
+
+
+async def _run_leased(
+    queue: WorkQueue,
+    task: Task,
+    client: GraphQLClient,
+    checkpoints: CheckpointStore | None,
+) -> None:
+    """Run a task while keeping its lease, stop it if the lease is lost."""
+
+    heartbeat = asyncio.ensure_future(_keep_lease(queue, task))
+    work = asyncio.ensure_future(run_task(task, client, checkpoints))
+    try:
+        await asyncio.wait({heartbeat, work}, return_when=asyncio.FIRST_COMPLETED)
+        if heartbeat.done():
+            heartbeat.result()
+        work.result()
+    finally:
+        heartbeat.cancel()
+        work.cancel()
+        await asyncio.gather(heartbeat, work, return_exceptions=True)
+
+
+async def work_queue(
+    queue: WorkQueue,
+    workers: int = 8,
+    checkpoints: CheckpointStore | None = None,
+    kinds: list[str] | None = None,
+    poll_interval: float = 5.0,
+) -> Throughput:
+    """Crawl tasks from a shared queue with a pool of concurrent workers.
+
+    Several processes, on one or more machines, can work on the same queue.
+    Workers wait while other workers hold leases, so that tasks of a crashed
+    worker are taken over once their lease expires, and stop when every task
+    is done or failed for good. Only tasks of `kinds` are taken if given.
+    """
+
+    name = f"{socket.gethostname()}-{os.getpid()}"
+    async with GraphQLClient(max_concurrency=2 * workers) as client:
+        throughput = Throughput(client)
+
+        async def worker(i: int) -> None:
+            while True:
+                task = await asyncio.to_thread(queue.claim, f"{name}-{i}", kinds)
+                if task is None:
+                    if await asyncio.to_thread(queue.is_finished):
+                        return
+                    await asyncio.sleep(poll_interval)
+                    continue
+
+                try:
+                    await _run_leased(queue, task, client, checkpoints)
+                except LeaseLost as e:
+                    logging.warning(str(e))
+                    continue
+                except Exception as e:
+                    throughput.failed += 1
+                    logging.error(f"Failed {task.kind} of {task.key}: {e}")
+                    await asyncio.to_thread(queue.fail, task, repr(e))
+                    continue
+                await asyncio.to_thread(queue.complete, task)
+                throughput.repos += 1
+                logging.info(f"Done {task.kind} of {task.key}, {throughput}")
+
+        await asyncio.gather(*(worker(i) for i in range(workers)))
+
+    logging.info(f"Queue: {queue.counts()}, worked {throughput}")
+    logging.info(f"HTTP requests:\n{STATS}")
+    return throughput
+
+
+def main(
+    workers: int = 8,
+    incremental: bool = False,
+    batch_size: int = 1,
+    checkpoint_path: Path | str = DEFAULT_CHECKPOINT_PATH,
+    budget: int | None = None,
+    queue_path: Path | str | None = None,
+    enqueue: bool = False,
+) -> None:
+    """Crawl data.
+
+    With a `budget` of API pages, the stalest and most active repos are
+    refreshed first (see `plan_refresh`) until it is used up. With a
+    `queue_path`, the repos are queued as tasks there if `enqueue`, otherwise
+    this process works on the tasks of the queue.
+    """
+    # Repo discovery, "uw-madison" is somehow not a subset of "madison"
+    # discover_repos(["madison", "wisconsin", "wisc.edu", "uw-madison"])
+
+    # READMEs, only needed to categorize repos, are fetched by enrich.main
 
     # History
-    with Session(ENGINE) as session:
-        query = session.query(Repo.url)
+    create_missing_tables()
+    add_missing_columns()
+    create_missing_indexes()
+    checkpoints = CheckpointStore(checkpoint_path)
+    if queue_path is not None and not enqueue:
+        queue = WorkQueue(queue_path)
+        asyncio.run(work_queue(queue, workers=workers, checkpoints=checkpoints))
+        return
 
-    repos = [row.url for row in query]
-    for repo in tqdm(repos):
-        try:
-            crawl_history(repo, skip_existing=True)
-        except Exception as e:
-            logging.error(f"Failed to crawl {repo}: {e}")
+    if budget is not None:
+        repos = plan_refresh(get_repo_states(), budget)
+        incremental = True
+    else:
+        with Session(ENGINE) as session:
+            repos = [row.url for row in session.query(Repo.url)]
+
+    if queue_path is not None:
+        queue = WorkQueue(queue_path)
+        last_commit_times = get_last_commit_times() if incremental else {}
+        crawled = get_crawled_repos()
+        repos = [url for url in repos if url in last_commit_times or url not in crawled]
+        n_tasks = enqueue_histories(queue, repos, since=last_commit_times)
+        logging.info(f"Queued {n_tasks} tasks, {queue.counts()}")
+        return
+
+    asyncio.run(
+        crawl_histories(
+            repos,
+            workers=workers,
+            skip_existing=True,
+            incremental=incremental,
+            batch_size=batch_size,
+            checkpoints=checkpoints,
+            max_pages=budget,
+        )
+    )
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Crawl GitHub repository history.")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Fetch new commits and stars of crawled repos instead of skipping them",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help="Number of repos to fetch per request with aliased queries",
+    )
+    parser.add_argument(
+        "--checkpoint-path",
+        default=DEFAULT_CHECKPOINT_PATH,
+        help="SQLite file where crawl progress is recorded to resume from",
+    )
+    parser.add_argument(
+        "--budget",
+        type=int,
+        default=None,
+        help="API pages to spend, on the repos most likely to have new history",
+    )
+    parser.add_argument(
+        "--queue-path",
+        default=None,
+        help="SQLite work queue shared by workers, to split a crawl across processes",
+    )
+    parser.add_argument(
+        "--enqueue",
+        action="store_true",
+        help="Queue the repos to crawl in --queue-path instead of crawling them",
+    )
+    main(**vars(parser.parse_args()))
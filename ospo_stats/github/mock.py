@@ -0,0 +1,573 @@
+"""Local stand-in for the GitHub GraphQL endpoint, to test crawl throughput offline.
+
+Run a quick throughput check against it with:
+
+    python -m ospo_stats.github.mock --requests 200 --latency 0.1
+
+and check that tokens add up, in throughput and in budget, with:
+
+    python -m ospo_stats.github.mock --check-tokens
+
+`SyntheticGitHub` answers discovery, stargazer, commit and README queries
+with generated repos, see `ospo_stats.github.benchmark` for crawl benchmarks.
+"""
+
+import argparse
+import asyncio
+import base64
+import bisect
+import hashlib
+import json
+import math
+import multiprocessing
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterator
+
+from ospo_stats.github.client import GraphQLClient, PooledToken
+
+SEARCH_RESULT_LIMIT = 1000  # Like GitHub, search results beyond are not served
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+_SEARCH = re.compile(
+    r'query: "(?P<term>.*) created:(?P<start>[\d-]+)\.\.(?P<end>[\d-]+)"'
+)
+_REPOSITORY = re.compile(r'(?:(\w+): )?repository\(owner: "([^"]+)", name: "([^"]+)"\)')
+_FIRST = re.compile(r"first: (\d+)")
+_AFTER = re.compile(r'after: "([^"]+)"')
+_SINCE = re.compile(r'since: "([^"]+)"')
+
+
+def empty_handler(query: str) -> dict:
+    """Answer every query with an empty GraphQL payload."""
+    return {"data": {}}
+
+
+def encode_cursor(offset: int) -> str:
+    """Opaque cursor of the item at `offset`, like GitHub's base64 cursors."""
+    return base64.b64encode(f"cursor:{offset}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> int:
+    return int(base64.b64decode(cursor).decode().removeprefix("cursor:"))
+
+
+def _page_info(end: int, total: int) -> dict:
+    return {"endCursor": encode_cursor(end), "hasNextPage": end < total}
+
+
+@dataclass
+class SyntheticRepo:
+    """A generated repo, its history spread evenly between creation and last push."""
+
+    owner: str
+    name: str
+    created_at: datetime
+    pushed_at: datetime
+    n_commits: int
+    n_stargazers: int
+    readme_size: int  # 0 for no README
+
+    @property
+    def url(self) -> str:
+        return f"https://github.com/{self.owner}/{self.name}"
+
+    def commit_time(self, i: int) -> datetime:
+        """Time of the i-th oldest commit."""
+        step = (self.pushed_at - self.created_at) / self.n_commits
+        return self.created_at + step * (i + 1)
+
+    def star_time(self, i: int, now: datetime) -> datetime:
+        """Time of the i-th oldest star."""
+        step = (now - self.created_at) / max(self.n_stargazers, 1)
+        return self.created_at + step * (i + 1)
+
+    def readme_text(self) -> str:
+        text = f"# {self.name}\n\n"
+        if self.readme_size % 2:
+            text += (
+                f"![build](https://img.shields.io/badge/{self.name}-passing-green)\n\n"
+            )
+        paragraph = f"Synthetic repository {self.owner}/{self.name} for benchmarks.\n"
+        repeats = max(self.readme_size - len(text), 0) // len(paragraph) + 1
+        return text + paragraph * repeats
+
+
+class SyntheticGitHub:
+    """Query handler that answers with synthetic repos, for `MockGitHub`.
+
+    Each search term matches `n_repos` repos, created uniformly at random
+    between `start_year` and now, an `overlap` fraction of which every term
+    matches. The number of commits and stargazers of a
+    repo is drawn from lognormal distributions with medians `commits` and
+    `stargazers`, so a few repos are much larger than the rest. Any repo name
+    can be queried, its data is seeded by its name so that every query and
+    every run sees the same repo.
+
+    Discovery searches (in full or urls only), stargazers (oldest or newest
+    first), commits (with `since`), README blobs, repo fields and aliased
+    batches of them are answered in the shapes of the queries in
+    `ospo_stats.github.query`.
+    """
+
+    def __init__(
+        self,
+        n_repos: int = 1000,
+        commits: int = 100,
+        stargazers: int = 20,
+        start_year: int = 2008,
+        seed: int = 0,
+        owner: str = "synthetic",
+        overlap: float = 0.0,
+    ) -> None:
+        self.n_repos = n_repos
+        self.overlap = overlap
+        self.commits = commits
+        self.stargazers = stargazers
+        self.start = datetime(start_year, 1, 1)
+        self.now = datetime.now().replace(microsecond=0)
+        self.seed = seed
+        self.owner = owner
+
+        # Cached per instance, the handler is called from many server threads
+        self.get_repo = lru_cache(maxsize=100_000)(self._make_repo)
+        self.get_term_repos = lru_cache(maxsize=None)(self._make_term_repos)
+
+    def _make_repo(self, owner: str, name: str) -> SyntheticRepo:
+        rng = random.Random(f"{self.seed}/{owner}/{name}")
+        span = (self.now - self.start).total_seconds()
+        created_at = self.start + timedelta(seconds=int(rng.uniform(0, span)))
+        pushed_span = (self.now - created_at).total_seconds()
+        pushed_at = created_at + timedelta(seconds=int(rng.uniform(0, pushed_span)))
+        n_commits = max(1, round(rng.lognormvariate(math.log(self.commits), 1.0)))
+        n_stargazers = round(rng.lognormvariate(math.log(self.stargazers + 1), 1.5)) - 1
+        readme_size = round(rng.lognormvariate(math.log(2000), 1.0))
+        if rng.random() < 0.1:
+            readme_size = 0
+        return SyntheticRepo(
+            owner=owner,
+            name=name,
+            created_at=created_at,
+            pushed_at=pushed_at,
+            n_commits=n_commits,
+            n_stargazers=max(n_stargazers, 0),
+            readme_size=readme_size,
+        )
+
+    def _make_term_repos(self, term: str) -> tuple[list[SyntheticRepo], list[date]]:
+        """Repos matching a term, sorted by creation, and their creation dates."""
+
+        slug = re.sub(r"[^\w.-]+", "-", term).strip("-")
+        n_shared = round(self.overlap * self.n_repos)
+        names = [f"shared-{i}" for i in range(n_shared)]
+        names += [f"{slug}-{i}" for i in range(n_shared, self.n_repos)]
+        repos = [self.get_repo(self.owner, name) for name in names]
+        repos.sort(key=lambda repo: repo.created_at)
+        return repos, [repo.created_at.date() for repo in repos]
+
+    def __call__(self, query: str) -> dict:
+        if "search(" in query:
+            return {"data": {"search": self.search(query)}}
+
+        data = {}
+        parts = _REPOSITORY.split(query)
+        for i in range(1, len(parts), 4):
+            alias, owner, name, fields = parts[i : i + 4]
+            data[alias or "repository"] = self.repository(owner, name, fields)
+        return {"data": data}
+
+    def search(self, query: str) -> dict:
+        """Answer a discovery query, see `get_repo_discovery_query`."""
+
+        match = _SEARCH.search(query)
+        repos, created = self.get_term_repos(match["term"])
+        lo = bisect.bisect_left(created, date.fromisoformat(match["start"]))
+        hi = bisect.bisect_right(created, date.fromisoformat(match["end"]))
+        total = hi - lo
+
+        after = _AFTER.search(query)
+        offset = decode_cursor(after[1]) if after else 0
+        end = min(offset + int(_FIRST.search(query)[1]), total, SEARCH_RESULT_LIMIT)
+        return {
+            "repositoryCount": total,
+            "pageInfo": _page_info(end, min(total, SEARCH_RESULT_LIMIT)),
+            "repos": [{"repo": self.node(repos[lo + i])} for i in range(offset, end)],
+        }
+
+    def node(self, repo: SyntheticRepo) -> dict:
+        """The discovery fields of a repo."""
+
+        node = {
+            "owner": {"login": repo.owner},
+            "name": repo.name,
+            "url": repo.url,
+            "homepageUrl": None,
+            "licenseInfo": {"key": "mit", "name": "MIT License"},
+            "description": f"Synthetic repository {repo.name}",
+            "createdAt": f"{repo.created_at:{DATE_FORMAT}}",
+            "pushedAt": f"{repo.pushed_at:{DATE_FORMAT}}",
+            "stargazers": {"totalCount": repo.n_stargazers},
+            "watchers": {"totalCount": repo.n_stargazers // 10},
+            "forks": {"totalCount": repo.n_stargazers // 5},
+            "total_issues": {"totalCount": repo.n_commits // 10},
+            "open_issues": {"totalCount": repo.n_commits // 50},
+            "defaultBranchRef": {"target": {"history": {"totalCount": repo.n_commits}}},
+        }
+        return node
+
+    def repository(self, owner: str, name: str, fields: str) -> dict:
+        """Answer the fields selected on one repository."""
+
+        repo = self.get_repo(owner, name)
+        if "createdAt" in fields:
+            return self.node(repo)
+
+        data = {}
+        if "stargazers(" in fields:
+            data["stargazers"] = self.stargazers_page(repo, fields)
+        if "history(" in fields:
+            data["defaultBranchRef"] = {
+                "target": {"history": self.commits_page(repo, fields)}
+            }
+        if "readme_standard" in fields:
+            data.update(self.readme(repo, text="text" in fields))
+        return data
+
+    def stargazers_page(self, repo: SyntheticRepo, fields: str) -> dict:
+        after = _AFTER.search(fields)
+        offset = decode_cursor(after[1]) if after else 0
+        total = repo.n_stargazers
+        end = min(offset + int(_FIRST.search(fields)[1]), total)
+        newest_first = "DESC" in fields
+
+        edges = []
+        for rank in range(offset, end):
+            i = total - 1 - rank if newest_first else rank
+            edges.append(
+                {
+                    "starredAt": f"{repo.star_time(i, self.now):{DATE_FORMAT}}",
+                    "node": {"login": f"{repo.name}-user{i}"},
+                }
+            )
+        return {"totalCount": total, "edges": edges, "pageInfo": _page_info(end, total)}
+
+    def commits_page(self, repo: SyntheticRepo, fields: str) -> dict:
+        """A page of the commits of a repo, newest first like GitHub."""
+
+        after = _AFTER.search(fields)
+        offset = decode_cursor(after[1]) if after else 0
+        total = repo.n_commits
+        since = _SINCE.search(fields)
+        if since:
+            since = datetime.strptime(since[1], DATE_FORMAT)
+            total = sum(1 for _ in self._commits_since(repo, since))
+        end = min(offset + int(_FIRST.search(fields)[1]), total)
+
+        edges = []
+        for rank in range(offset, end):
+            i = repo.n_commits - 1 - rank
+            sha = hashlib.sha1(f"{repo.url}/{i}".encode()).hexdigest()
+            edges.append(
+                {
+                    "node": {
+                        "id": f"C_{sha[:20]}",
+                        "committedDate": f"{repo.commit_time(i):{DATE_FORMAT}}",
+                        "url": f"{repo.url}/commit/{sha}",
+                        "additions": i * 7919 % 500,
+                        "deletions": i * 104729 % 200,
+                        "committer": {
+                            "name": f"Developer {i % 7}",
+                            "email": f"dev{i % 7}@example.com",
+                        },
+                    }
+                }
+            )
+        return {"totalCount": total, "edges": edges, "pageInfo": _page_info(end, total)}
+
+    @staticmethod
+    def _commits_since(repo: SyntheticRepo, since: datetime) -> Iterator[int]:
+        i = repo.n_commits - 1
+        while i >= 0 and repo.commit_time(i) >= since:
+            yield i
+            i -= 1
+
+    def readme(self, repo: SyntheticRepo, text: bool) -> dict:
+        """The README blobs of a repo, only README.md exists if any."""
+
+        blob = None
+        if repo.readme_size:
+            readme = repo.readme_text()
+            blob = {
+                "byteSize": len(readme.encode()),
+                "oid": hashlib.sha1(readme.encode()).hexdigest(),
+            }
+            if text:
+                blob["text"] = readme
+        return {"readme_standard": blob, "readme_lower": None}
+
+
+class MockGitHub:
+    """GraphQL endpoint on localhost that emulates GitHub latency and rate limits.
+
+    Every request costs its token one point out of `limit` per `window`
+    seconds. The `X-RateLimit-*` headers are sent like GitHub does, and
+    requests beyond the budget of their token are rejected with a 403 until
+    its window resets.
+
+    Failures are injected at random: a `bad_gateway_rate` fraction of the
+    requests fail with a 502, and a `secondary_limit_rate` fraction with a
+    secondary rate limit 403, asking to retry after `retry_after` seconds.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[str], dict] = empty_handler,
+        latency: float = 0.05,
+        limit: int = 5000,
+        window: float = 3600.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        bad_gateway_rate: float = 0.0,
+        secondary_limit_rate: float = 0.0,
+        retry_after: int = 1,
+        seed: int | None = None,
+    ) -> None:
+        self.handler = handler
+        self.latency = latency
+        self.limit = limit
+        self.window = window
+        self.bad_gateway_rate = bad_gateway_rate
+        self.secondary_limit_rate = secondary_limit_rate
+        self.retry_after = retry_after
+        self.requests = 0
+        self.errors = 0  # Injected failures
+
+        self._budgets: dict[str, tuple[int, float]] = {}  # (remaining, reset_at)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_request_handler())
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/graphql"
+
+    def start(self) -> "MockGitHub":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "MockGitHub":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _inject_failure(self) -> tuple[int, dict[str, str], dict] | None:
+        """Draw whether a request fails, return its status, headers and body if so."""
+
+        with self._lock:
+            draw = self._random.random()
+            if draw < self.bad_gateway_rate:
+                self.errors += 1
+                return 502, {}, {"message": "Server Error"}
+            if draw < self.bad_gateway_rate + self.secondary_limit_rate:
+                self.errors += 1
+                message = "You have exceeded a secondary rate limit."
+                return 403, {"Retry-After": str(self.retry_after)}, {"message": message}
+        return None
+
+    def _spend(self, token: str) -> tuple[int, dict[str, str]]:
+        """Charge one point to a token, return the status and rate limit headers."""
+
+        with self._lock:
+            self.requests += 1
+            now = time.time()
+            remaining, reset_at = self._budgets.get(token, (self.limit, 0.0))
+            if now >= reset_at:
+                remaining, reset_at = self.limit, now + self.window
+
+            status = 200
+            if remaining > 0:
+                remaining -= 1
+            else:
+                status = 403
+            self._budgets[token] = (remaining, reset_at)
+
+            headers = {
+                "X-RateLimit-Limit": str(self.limit),
+                "X-RateLimit-Remaining": str(remaining),
+                "X-RateLimit-Reset": str(int(reset_at)),
+            }
+        return status, headers
+
+    def _make_request_handler(self) -> type[BaseHTTPRequestHandler]:
+        mock = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length", 0))
+                query = json.loads(self.rfile.read(length))["query"]
+                time.sleep(mock.latency)
+
+                status, headers = mock._spend(self.headers.get("Authorization", ""))
+                failure = mock._inject_failure() if status == 200 else None
+                if failure is not None:
+                    status, extra_headers, body = failure
+                    headers = {**headers, **extra_headers}
+                elif status == 200:
+                    body = mock.handler(query)
+                else:
+                    body = {"message": "API rate limit exceeded"}
+                payload = json.dumps(body).encode()
+
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format: str, *args) -> None:
+                pass  # Keep test output quiet
+
+        return RequestHandler
+
+
+def _serve(handler_options: dict, options: dict, urls: multiprocessing.Queue) -> None:
+    mock = MockGitHub(SyntheticGitHub(**handler_options), **options).start()
+    urls.put(mock.url)
+    mock._thread.join()
+
+
+@contextmanager
+def serve_in_process(handler_options: dict | None = None, **options) -> Iterator[str]:
+    """Run a `MockGitHub` with a `SyntheticGitHub` handler in another process.
+
+    Yields the url of the endpoint. Keeping the server out of the process of
+    the crawler being measured keeps it from competing for the GIL, and its
+    memory out of the measurements. `handler_options` are passed on to
+    `SyntheticGitHub` and the other options to `MockGitHub`.
+    """
+
+    urls = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=_serve, args=(handler_options or {}, options, urls), daemon=True
+    )
+    process.start()
+    try:
+        yield urls.get(timeout=30)
+    finally:
+        process.terminate()
+        process.join()
+
+
+async def measure_throughput(
+    url: str,
+    n_requests: int,
+    max_concurrency: int = 8,
+    max_rate: float = 100.0,
+    n_tokens: int = 1,
+) -> float:
+    """Send `n_requests` queries concurrently and return the requests per second."""
+
+    start = time.perf_counter()
+    async with GraphQLClient(
+        url=url,
+        max_concurrency=max_concurrency,
+        max_rate=max_rate,
+        tokens=[f"mock-{i}" for i in range(n_tokens)],
+        cache=False,  # Measure requests, not cache hits
+    ) as client:
+        await asyncio.gather(*(client.query("{}") for _ in range(n_requests)))
+    return n_requests / (time.perf_counter() - start)
+
+
+def check_token_pool(
+    n_requests: int = 50, max_rate: float = 10.0, latency: float = 0.05
+) -> None:
+    """Check that each token adds `max_rate` and its budget to the client.
+
+    Raises an `AssertionError` if the requests per second do not grow with the
+    number of tokens, or if a token is exhausted while another has budget.
+    """
+
+    with MockGitHub(latency=latency) as mock:
+        rates = {
+            n_tokens: asyncio.run(
+                measure_throughput(
+                    mock.url, n_requests * n_tokens, 8, max_rate, n_tokens
+                )
+            )
+            for n_tokens in (1, 2, 4)
+        }
+    for n_tokens, rate in rates.items():
+        print(f"{n_tokens} tokens: {rate:.1f} requests/sec")
+        assert rate > 0.8 * n_tokens * rates[1], f"{n_tokens} tokens do not add up"
+
+    async def spend(url: str) -> list[PooledToken]:
+        async with GraphQLClient(
+            url=url, max_rate=100.0, tokens=["mock-a", "mock-b"], cache=False
+        ) as client:
+            await asyncio.gather(*(client.query("{}") for _ in range(1700)))
+        return client.pool.tokens
+
+    with MockGitHub(latency=latency, limit=1000) as mock:
+        tokens = asyncio.run(spend(mock.url))
+    print(f"1700 requests over 2 tokens of 1000: {tokens}")
+    assert all(t.resume_at == 0 for t in tokens), "A token was parked"
+    assert all(t.rate_limit.remaining >= 100 for t in tokens), "Unbalanced tokens"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--max-rate", type=float, default=100.0)
+    parser.add_argument("--tokens", type=int, default=1)
+    parser.add_argument("--bad-gateway-rate", type=float, default=0.0)
+    parser.add_argument("--secondary-limit-rate", type=float, default=0.0)
+    parser.add_argument("--check-tokens", action="store_true")
+    args = parser.parse_args()
+
+    if args.check_tokens:
+        check_token_pool(latency=args.latency)
+        print("Token pool checks passed")
+        return
+
+    with MockGitHub(
+        latency=args.latency,
+        bad_gateway_rate=args.bad_gateway_rate,
+        secondary_limit_rate=args.secondary_limit_rate,
+    ) as mock:
+        rate = asyncio.run(
+            measure_throughput(
+                mock.url,
+                args.requests,
+                args.concurrency,
+                max_rate=args.max_rate,
+                n_tokens=args.tokens,
+            )
+        )
+    print(f"{args.requests} requests at {rate:.1f} requests/sec")
+
+
+if __name__ == "__main__":
+    main()
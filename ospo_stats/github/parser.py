@@ -1,10 +1,19 @@
 import json
 import logging
-import re
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from itertools import repeat
 from pathlib import Path
+from typing import Iterable, Mapping, Sequence
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from ospo_stats.github.archive import RawArchive
+from ospo_stats.readme import analyze_readme
 
 
 def get_owner_and_repo_name(url: str) -> tuple[str, str]:
@@ -14,104 +23,349 @@ def get_owner_and_repo_name(url: str) -> tuple[str, str]:
     return x[0], x[1]
 
 
-def has_image(readme_content: str) -> bool:
-    """Check if the README contains an image."""
+def has_image(readme_content: str | None) -> bool:
+    """Check if the README contains an image, see `analyze_readme`."""
 
-    # Regex for Markdown image
-    markdown_image_regex = r"!\[.*?\]\(.*?\)"
+    return analyze_readme(readme_content).has_image
 
-    # Regex for HTML img tag
-    html_image_regex = r"<img .*?src=\".*?\".*?>"
 
-    # Search for images
-    contains_markdown_image = (
-        re.search(markdown_image_regex, readme_content) is not None
-    )
-    contains_html_image = re.search(html_image_regex, readme_content) is not None
+def get_readme_blob(repo: dict) -> dict | None:
+    """Get the README blob of a repository, README.md first, then readme.md."""
 
-    return contains_markdown_image or contains_html_image
+    return repo.get("readme_standard") or repo.get("readme_lower")
 
 
-def parse_discover_response(data: dict) -> dict | None:
-    """Flatten the data from the GitHub API to make it easier to work with."""
+def parse_timestamps(values: Sequence[str | None]) -> np.ndarray:
+    """Parse ISO 8601 timestamps at once into a UTC `datetime64[s]` array.
+
+    GitHub timestamps have the fixed format `%Y-%m-%dT%H:%M:%SZ` in UTC,
+    which numpy parses in one vectorized pass once the `Z` is dropped.
+    Timestamps with another offset, like `+02:00`, are converted to UTC one
+    by one. Missing values become NaT.
+    """
+
+    utc = [
+        value[:-1] if value and value[-1] == "Z" else _to_utc(value) for value in values
+    ]
+    return np.array(utc, dtype="datetime64[s]")
+
+
+def _to_utc(value: str | None) -> str:
+    if value is None:
+        return "NaT"
+    timestamp = datetime.fromisoformat(value)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp.isoformat()
+
+
+def parse_datetimes(
+    values: Sequence[str | None], aware: bool = False
+) -> list[datetime | None]:
+    """Parse timestamps like `parse_timestamps`, into `datetime` objects.
+
+    Datetimes are naive in UTC, like the database stores them, unless `aware`.
+    """
+
+    datetimes = parse_timestamps(values).astype(object).tolist()
+    if aware:
+        return [dt and dt.replace(tzinfo=timezone.utc) for dt in datetimes]
+    return datetimes
+
+
+def parse_discover_responses(data: Iterable[dict]) -> list[dict]:
+    """Flatten many repos of the GitHub API at once, see `parse_discover_response`.
+
+    Empty repos, and repos saved with their url only because an earlier term
+    of the same discovery run found them, are left out.
+    """
+
+    repos = [
+        d["repo"]
+        for d in data
+        if "createdAt" in d["repo"] and d["repo"]["defaultBranchRef"] is not None
+    ]
+    created_at = parse_datetimes([repo["createdAt"] for repo in repos])
+    last_pushed_at = parse_datetimes([repo["pushedAt"] for repo in repos])
+    return [_flatten_repo(*row) for row in zip(repos, created_at, last_pushed_at)]
 
-    empty = data["repo"]["defaultBranchRef"] is None
-    if empty:
-        return None
 
+def _flatten_repo(repo: dict, created_at: datetime, last_pushed_at: datetime) -> dict:
     output = {
-        "url": data["repo"]["url"],
-        "created_at": datetime.strptime(
-            data["repo"]["createdAt"], "%Y-%m-%dT%H:%M:%SZ"
-        ),
-        "last_pushed_at": datetime.strptime(
-            data["repo"]["pushedAt"], "%Y-%m-%dT%H:%M:%SZ"
-        ),
-        "owner": data["repo"]["owner"]["login"],
-        "name": data["repo"]["name"],
-        "description": data["repo"]["description"],
-        "total_stargazer_count": data["repo"]["stargazers"]["totalCount"],
-        "total_issues_count": data["repo"]["total_issues"]["totalCount"],
-        "total_open_issues_count": data["repo"]["open_issues"]["totalCount"],
-        "total_forks_count": data["repo"]["forks"]["totalCount"],
-        "total_watchers_count": data["repo"]["watchers"]["totalCount"],
+        "url": repo["url"],
+        "created_at": created_at,
+        "last_pushed_at": last_pushed_at,
+        "owner": repo["owner"]["login"],
+        "name": repo["name"],
+        "description": repo["description"],
+        "total_stargazer_count": repo["stargazers"]["totalCount"],
+        "total_commit_count": repo["defaultBranchRef"]["target"]["history"][
+            "totalCount"
+        ],
+        "total_issues_count": repo["total_issues"]["totalCount"],
+        "total_open_issues_count": repo["open_issues"]["totalCount"],
+        "total_forks_count": repo["forks"]["totalCount"],
+        "total_watchers_count": repo["watchers"]["totalCount"],
     }
 
-    # Append optional fields
-    if data["repo"]["readme_standard"]:
-        output["readme"] = data["repo"]["readme_standard"]["text"]
-    elif data["repo"]["readme_lower"]:
-        logging.info(f"{data['repo']['url']} used a lowercase README file")
-        output["readme"] = data["repo"]["readme_lower"]["text"]
-    else:
-        logging.info(f"{data['repo']['url']} had no README file")
-
-    if "readme" in output:
+    # Append optional fields. Discovery no longer fetches the README text, but
+    # files saved before it moved to its own stage still have it
+    readme = get_readme_blob(repo)
+    if readme and readme.get("text") is not None:
+        output["readme"] = readme["text"]
         output["readme_has_image"] = has_image(output["readme"])
 
-    if data["repo"]["licenseInfo"]:
-        output["license_key"] = data["repo"]["licenseInfo"]["key"]
-        output["license_name"] = data["repo"]["licenseInfo"]["name"]
+    if repo["licenseInfo"]:
+        output["license_key"] = repo["licenseInfo"]["key"]
+        output["license_name"] = repo["licenseInfo"]["name"]
 
-    if data["repo"]["homepageUrl"]:
-        output["homepage_url"] = data["repo"]["homepageUrl"]
+    if repo["homepageUrl"]:
+        output["homepage_url"] = repo["homepageUrl"]
 
     return output
 
 
+def parse_discover_response(data: dict) -> dict | None:
+    """Flatten the data from the GitHub API to make it easier to work with.
+
+    Returns None for empty repos, and for repos saved with their url only
+    because an earlier term of the same discovery run found them.
+    """
+
+    parsed = parse_discover_responses([data])
+    return parsed[0] if parsed else None
+
+
+def parse_stargazers_batch(raw_data: list[dict]) -> list[dict]:
+    """Parse pages of stargazer edges at once."""
+
+    starred_at = parse_datetimes([edge["starredAt"] for edge in raw_data])
+    return [
+        {"starred_at": time, "user": edge["node"]["login"]}
+        for edge, time in zip(raw_data, starred_at)
+    ]
+
+
 def parse_stargazers(raw_data: dict) -> dict:
-    return {
-        "starred_at": datetime.strptime(raw_data["starredAt"], "%Y-%m-%dT%H:%M:%SZ"),
-        "user": raw_data["node"]["login"],
-    }
+    return parse_stargazers_batch([raw_data])[0]
+
+
+def parse_commits_batch(raw_data: list[dict]) -> list[dict]:
+    """Parse pages of commit edges at once."""
+
+    nodes = [edge["node"] for edge in raw_data]
+    committed_at = parse_datetimes([node["committedDate"] for node in nodes])
+    return [
+        {
+            "committed_at": time,
+            "url": node["url"],
+            "additions": node["additions"],
+            "deletions": node["deletions"],
+            "committer_name": node["committer"]["name"],
+            "committer_email": node["committer"]["email"],
+        }
+        for node, time in zip(nodes, committed_at)
+    ]
 
 
 def parse_commits(raw_data: dict) -> dict:
-    return {
-        "committed_at": datetime.strptime(
-            raw_data["node"]["committedDate"], "%Y-%m-%dT%H:%M:%SZ"
-        ),
-        "url": raw_data["node"]["url"],
-        "additions": raw_data["node"]["additions"],
-        "deletions": raw_data["node"]["deletions"],
-        "committer_name": raw_data["node"]["committer"]["name"],
-        "committer_email": raw_data["node"]["committer"]["email"],
+    return parse_commits_batch([raw_data])[0]
+
+
+# Arrow schemas of the columnar mode, with the columns of the database tables
+REPO_SCHEMA = pa.schema(
+    [
+        ("url", pa.string()),
+        ("created_at", pa.timestamp("s")),
+        ("last_pushed_at", pa.timestamp("s")),
+        ("owner", pa.string()),
+        ("name", pa.string()),
+        ("description", pa.string()),
+        ("homepage_url", pa.string()),
+        ("license_key", pa.string()),
+        ("license_name", pa.string()),
+        ("total_stargazer_count", pa.int64()),
+        ("total_commit_count", pa.int64()),
+        ("total_issues_count", pa.int64()),
+        ("total_open_issues_count", pa.int64()),
+        ("total_forks_count", pa.int64()),
+        ("total_watchers_count", pa.int64()),
+    ]
+)
+COMMIT_SCHEMA = pa.schema(
+    [
+        ("url", pa.string()),
+        ("repo_url", pa.string()),
+        ("committed_at", pa.timestamp("s")),
+        ("additions", pa.int64()),
+        ("deletions", pa.int64()),
+        ("committer_name", pa.string()),
+        ("committer_email", pa.string()),
+    ]
+)
+STARGAZER_SCHEMA = pa.schema(
+    [
+        ("id", pa.string()),
+        ("repo_url", pa.string()),
+        ("user", pa.string()),
+        ("starred_at", pa.timestamp("s")),
+    ]
+)
+
+
+def repos_to_batch(data: Iterable[dict]) -> pa.RecordBatch:
+    """Build a record batch of `REPO_SCHEMA` from search results.
+
+    Like `parse_discover_responses`, empty and url-only repos are left out.
+    README text, which only old archives have, is left to `update_readmes`.
+    """
+
+    repos = [
+        d["repo"]
+        for d in data
+        if "createdAt" in d["repo"] and d["repo"]["defaultBranchRef"] is not None
+    ]
+    licenses = [repo["licenseInfo"] or {} for repo in repos]
+    columns = {
+        "url": [repo["url"] for repo in repos],
+        "created_at": parse_timestamps([repo["createdAt"] for repo in repos]),
+        "last_pushed_at": parse_timestamps([repo["pushedAt"] for repo in repos]),
+        "owner": [repo["owner"]["login"] for repo in repos],
+        "name": [repo["name"] for repo in repos],
+        "description": [repo["description"] for repo in repos],
+        "homepage_url": [repo["homepageUrl"] or None for repo in repos],
+        "license_key": [license.get("key") for license in licenses],
+        "license_name": [license.get("name") for license in licenses],
+        "total_stargazer_count": [repo["stargazers"]["totalCount"] for repo in repos],
+        "total_commit_count": [
+            repo["defaultBranchRef"]["target"]["history"]["totalCount"]
+            for repo in repos
+        ],
+        "total_issues_count": [repo["total_issues"]["totalCount"] for repo in repos],
+        "total_open_issues_count": [
+            repo["open_issues"]["totalCount"] for repo in repos
+        ],
+        "total_forks_count": [repo["forks"]["totalCount"] for repo in repos],
+        "total_watchers_count": [repo["watchers"]["totalCount"] for repo in repos],
+    }
+    return pa.RecordBatch.from_pydict(columns, schema=REPO_SCHEMA)
+
+
+def _repeat_urls(pages: Mapping[str, list[dict]]) -> list[str]:
+    """The repo url of each edge of the pages of many repos."""
+    return [url for url, edges in pages.items() for _ in edges]
+
+
+def commits_to_batch(pages: Mapping[str, list[dict]]) -> pa.RecordBatch:
+    """Build a record batch of `COMMIT_SCHEMA` from commit edges by repo url."""
+
+    nodes = [edge["node"] for edges in pages.values() for edge in edges]
+    columns = {
+        "url": [node["url"] for node in nodes],
+        "repo_url": _repeat_urls(pages),
+        "committed_at": parse_timestamps([node["committedDate"] for node in nodes]),
+        "additions": [node["additions"] for node in nodes],
+        "deletions": [node["deletions"] for node in nodes],
+        "committer_name": [node["committer"]["name"] for node in nodes],
+        "committer_email": [node["committer"]["email"] for node in nodes],
+    }
+    return pa.RecordBatch.from_pydict(columns, schema=COMMIT_SCHEMA)
+
+
+def stargazers_to_batch(pages: Mapping[str, list[dict]]) -> pa.RecordBatch:
+    """Build a record batch of `STARGAZER_SCHEMA` from stargazer edges by repo url."""
+
+    edges = [edge for page in pages.values() for edge in page]
+    repo_urls = pa.array(_repeat_urls(pages), pa.string())
+    users = pa.array([edge["node"]["login"] for edge in edges], pa.string())
+    columns = {
+        "id": pc.binary_join_element_wise(repo_urls, users, "/"),
+        "repo_url": repo_urls,
+        "user": users,
+        "starred_at": parse_timestamps([edge["starredAt"] for edge in edges]),
     }
+    return pa.RecordBatch.from_pydict(columns, schema=STARGAZER_SCHEMA)
+
+
+def write_parquet(
+    batches: Iterable[pa.RecordBatch], path: Path | str, schema: pa.Schema
+) -> int:
+    """Write record batches to a Parquet file as they come, return the rows."""
+
+    n_rows = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            n_rows += batch.num_rows
+    return n_rows
+
+
+LOAD_CACHE_NAME = "load_cache.parquet"
+_CACHE_KEY = b"ospo_stats.windows"
+
 
+def _load_window(root: str, term: str, year: int) -> pd.DataFrame:
+    """Parse the repos of one window, with the time it was last crawled."""
 
-def load(data_path: Path | str) -> pd.DataFrame:
-    """Load the raw data from the given path."""
+    archive = RawArchive(root)
+    df = pd.DataFrame(parse_discover_responses(archive.read_window(term, year)))
+    df["crawled_at"] = archive.window_path(term, year).stat().st_mtime_ns
+    return df
 
-    if not isinstance(data_path, Path):
-        data_path = Path(data_path)
 
-    data_files = data_path.glob("*.json")
+def _window_key(archive: RawArchive) -> bytes:
+    """Identify the window files and their versions, to validate the cache."""
 
-    parsed_data = []
-    for file in data_files:
-        logging.info(file)
-        with open(file, "r") as f:
-            data = json.load(f)
-        parsed_data.extend([parse_discover_response(d) for d in data])
+    files = []
+    for term, year in archive.windows():
+        stat = archive.window_path(term, year).stat()
+        files.append([term, year, stat.st_mtime_ns, stat.st_size])
+    return json.dumps(files).encode()
+
+
+def load(
+    data_path: Path | str, max_workers: int | None = None, cache: bool = True
+) -> pd.DataFrame:
+    """Load the raw data from the given path, one row per repo, see `RawArchive`.
+
+    Windows are parsed in a process pool, and repos found in several windows
+    keep the data of the window crawled last. The result is cached in
+    `LOAD_CACHE_NAME`, next to the windows, until any of them changes.
+    """
+
+    archive = RawArchive(data_path)
+    cache_path = archive.root / LOAD_CACHE_NAME
+    key = _window_key(archive)
+    if cache and cache_path.exists():
+        metadata = pq.read_schema(cache_path).metadata or {}
+        if metadata.get(_CACHE_KEY) == key:
+            return pq.read_table(cache_path).to_pandas()
+
+    windows = archive.windows()
+    if not windows:
+        return pd.DataFrame()
+    with ProcessPoolExecutor(max_workers) as executor:
+        terms, years = zip(*windows)
+        dfs = list(executor.map(_load_window, repeat(str(archive.root)), terms, years))
+
+    dfs = [df for df in dfs if len(df)]
+    if not dfs:
+        return pd.DataFrame()
+    df = (
+        pd.concat(dfs, ignore_index=True)
+        .sort_values("crawled_at", kind="stable")
+        .drop_duplicates("url", keep="last")
+        .drop(columns="crawled_at")
+        .sort_index(ignore_index=True)
+    )
+    logging.info(f"Loaded {len(df)} unique repos from {len(windows)} windows")
 
-    return pd.DataFrame([p for p in parsed_data if p is not None])
+    if cache:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata(
+            {**table.schema.metadata, _CACHE_KEY: key}
+        )
+        partial_path = cache_path.with_suffix(".partial")
+        pq.write_table(table, partial_path)
+        partial_path.replace(cache_path)
+    return df
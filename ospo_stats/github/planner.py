@@ -0,0 +1,159 @@
+import logging
+import math
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ospo_stats.db import ENGINE, Commit, Repo, Stargazer
+
+PAGE_SIZE = 100  # Commits or stargazers per API page
+DORMANT_DAYS = 180  # Activity decays by e every this many days without a push
+UNKNOWN_COMMITS = 50  # Assumed for uncrawled repos discovered without a count
+
+
+@dataclass
+class RepoState:
+    """What we know of a repo, as reported by GitHub and as stored."""
+
+    url: str
+    created_at: datetime
+    crawl_at: datetime | None  # When GitHub reported the counts
+    history_crawled_at: datetime | None
+    last_pushed_at: datetime | None
+    total_stargazer_count: int
+    total_commit_count: int | None
+    stored_stargazers: int = 0
+    stored_commits: int = 0
+
+    @property
+    def missing_stargazers(self) -> int:
+        return max(self.total_stargazer_count - self.stored_stargazers, 0)
+
+    @property
+    def reported_commits(self) -> int:
+        if self.total_commit_count is not None:
+            return self.total_commit_count
+        return self.stored_commits or UNKNOWN_COMMITS
+
+    @property
+    def missing_commits(self) -> int:
+        return max(self.reported_commits - self.stored_commits, 0)
+
+
+@dataclass
+class Plan:
+    """A repo to crawl, with the rows and API pages it is expected to take."""
+
+    url: str
+    rows: float
+    pages: int
+
+    @property
+    def priority(self) -> float:
+        return self.rows / self.pages
+
+
+def get_repo_states() -> list[RepoState]:
+    """Get the reported and stored history counts of every repo, in one query."""
+
+    with Session(ENGINE) as session:
+        commits = (
+            session.query(Commit.repo_url, func.count().label("n"))
+            .group_by(Commit.repo_url)
+            .subquery()
+        )
+        stargazers = (
+            session.query(Stargazer.repo_url, func.count().label("n"))
+            .group_by(Stargazer.repo_url)
+            .subquery()
+        )
+        query = (
+            session.query(
+                Repo.url,
+                Repo.created_at,
+                Repo.crawl_at,
+                Repo.history_crawled_at,
+                Repo.last_pushed_at,
+                Repo.total_stargazer_count,
+                Repo.total_commit_count,
+                func.coalesce(stargazers.c.n, 0),
+                func.coalesce(commits.c.n, 0),
+            )
+            .outerjoin(commits, commits.c.repo_url == Repo.url)
+            .outerjoin(stargazers, stargazers.c.repo_url == Repo.url)
+        )
+        return [RepoState(*row) for row in query]
+
+
+def estimate(state: RepoState, now: datetime) -> Plan:
+    """Estimate the new rows a crawl of a repo would get, and its API pages.
+
+    A repo whose history was never crawled gets the rows GitHub reported, plus
+    those expected since then. A crawled repo is refreshed incrementally, which
+    only fetches rows newer than the last crawl, so it only gets those expected
+    since its history was crawled. Rows are expected at the lifetime pace of
+    the repo, decayed by how long ago it was last pushed to.
+    """
+
+    reported_at = state.crawl_at or state.created_at
+    age_days = max((reported_at - state.created_at).days, 1)
+    if state.history_crawled_at is None:
+        since = reported_at
+        missing_commits = state.missing_commits
+        missing_stargazers = state.missing_stargazers
+    else:
+        since = state.history_crawled_at
+        missing_commits = missing_stargazers = 0
+    stale_days = max((now - since).days, 0)
+    idle_days = max((now - (state.last_pushed_at or state.created_at)).days, 0)
+    activity = math.exp(-idle_days / DORMANT_DAYS)
+
+    new_commits = state.reported_commits / age_days * stale_days * activity
+    new_stargazers = state.total_stargazer_count / age_days * stale_days * activity
+
+    commits = missing_commits + new_commits
+    stargazers = missing_stargazers + new_stargazers
+    # Commits and stargazers take at least one page each
+    pages = max(math.ceil(commits / PAGE_SIZE), 1) + max(
+        math.ceil(stargazers / PAGE_SIZE), 1
+    )
+    return Plan(state.url, commits + stargazers, pages)
+
+
+def plan_refresh(
+    states: list[RepoState],
+    budget: int,
+    min_rows: float = 1.0,
+    now: datetime | None = None,
+) -> list[str]:
+    """Pick the repos to crawl within a budget of API pages, most valuable first.
+
+    Repos are ranked by expected new rows per page (see `estimate`), so that
+    uncrawled repos and active repos go before dormant ones. Repos
+    expected to yield fewer than `min_rows` are not worth a crawl.
+    """
+
+    now = now or datetime.now(timezone.utc).replace(
+        tzinfo=None
+    )  # Naive UTC, like the database
+    plans = [estimate(state, now) for state in states]
+    plans = sorted(
+        (plan for plan in plans if plan.rows >= min_rows),
+        key=lambda plan: plan.priority,
+        reverse=True,
+    )
+
+    selected = []
+    spent = 0
+    for plan in plans:
+        if spent + plan.pages > budget:
+            continue  # A smaller repo may still fit
+        selected.append(plan.url)
+        spent += plan.pages
+
+    logging.info(
+        f"Planned {len(selected)} / {len(states)} repos for {spent} / {budget} pages"
+    )
+    return selected
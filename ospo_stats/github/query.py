@@ -1,20 +1,7 @@
-# This query is for discovering repositories with summary information like total commits, and total stargazers
-_REPO_DISCOVERY = """
-{{
-  search(
-    type: REPOSITORY
-    query: "{term} created:{year}-01-01..{year}-12-31"
-    first: {per_page}
-    {after_line}
-  ) {{
-    repositoryCount
-    pageInfo {{
-      endCursor
-      hasNextPage
-    }}
-    repos: edges {{
-      repo: node {{
-        ... on Repository {{
+from datetime import date, datetime
+
+# Summary information of a repository, used by discovery and batched queries
+_REPO_FIELDS = """
           owner {{
             login
           }}
@@ -53,30 +40,58 @@ _REPO_DISCOVERY = """
               }}
             }}
           }}
-          readme_standard: object(expression: "HEAD:README.md") {{
-            ... on Blob {{
-              text
-            }}
-          }}
-          readme_lower: object(expression: "HEAD:readme.md") {{
-            ... on Blob {{
-              text
-            }}
-          }}
-        }}
+"""
+
+# Search for repositories matching a term created within dates, up to their fields
+_SEARCH_START = """
+{{
+  search(
+    type: REPOSITORY
+    query: "{term} created:{start}..{end}"
+    first: {per_page}
+    {after_line}
+  ) {{
+    repositoryCount
+    pageInfo {{
+      endCursor
+      hasNextPage
+    }}
+    repos: edges {{
+      repo: node {{
+        ... on Repository {{"""
+_SEARCH_END = """        }}
       }}
     }}
   }}
 }}
 """
 
-# This query is for getting details of stargazers of a given repository
-_STARGAZERS = """
-{{
-  repository(owner: "{owner}", name: "{name}") {{
+# This query is for discovering repositories with summary information like total commits, and total stargazers
+_REPO_DISCOVERY = _SEARCH_START + _REPO_FIELDS + _SEARCH_END
+
+# This query is for discovering only the urls of repositories, see `get_repo_batch_query` for the rest
+_REPO_URL_DISCOVERY = _SEARCH_START + "\n          url\n" + _SEARCH_END
+
+# Fields for the README blob of a repository, used by discovery and README queries
+_README_FIELDS = """
+    readme_standard: object(expression: "HEAD:README.md") {{
+      ... on Blob {{
+        {blob_fields}
+      }}
+    }}
+    readme_lower: object(expression: "HEAD:readme.md") {{
+      ... on Blob {{
+        {blob_fields}
+      }}
+    }}
+"""
+
+# Fields for the stargazers of a repository, used by single and batched queries
+_STARGAZERS_FIELDS = """
     stargazers(
       first: 100
       {after_line}
+      {order_line}
       ) {{
       totalCount
       edges {{
@@ -90,20 +105,17 @@ _STARGAZERS = """
         hasNextPage
       }}
     }}
-  }}
-}}
 """
 
-# This query is for getting details of commit history of a given repository
-_COMMITS = """
-{{
-  repository(owner: "{owner}", name: "{name}") {{
+# Fields for the commit history of a repository, used by single and batched queries
+_COMMITS_FIELDS = """
     defaultBranchRef {{
       target {{
         ... on Commit {{
           history(
             first: 100
             {after_line}
+            {since_line}
             ) {{
             totalCount
             edges {{
@@ -127,23 +139,65 @@ _COMMITS = """
         }}
       }}
     }}
-  }}
+"""
+
+# This query is for getting details of stargazers of a given repository
+_STARGAZERS = (
+    """
+{{
+  repository(owner: "{owner}", name: "{name}") {{"""
+    + _STARGAZERS_FIELDS
+    + """  }}
 }}
 """
+)
+
+# This query is for getting details of commit history of a given repository
+_COMMITS = (
+    """
+{{
+  repository(owner: "{owner}", name: "{name}") {{"""
+    + _COMMITS_FIELDS
+    + """  }}
+}}
+"""
+)
+
+# One repository under a GraphQL alias, to fetch many repositories in one request
+_ALIASED_REPOSITORY = """
+  {alias}: repository(owner: "{owner}", name: "{name}") {{{fields}  }}"""
 
 
 def get_repo_discovery_query(
     term: str,
-    year: int,
+    year: int | None = None,
     per_page: int = 100,
     after: str | None = None,
     base_query: str = _REPO_DISCOVERY,
+    start: date | None = None,
+    end: date | None = None,
+    urls_only: bool = False,
 ) -> str:
-    """Get the GraphQL query for discovering repos."""
+    """Get the GraphQL query for discovering repos.
+
+    Repos are searched by creation date, within `year` or between the `start`
+    and `end` dates (inclusive) if given. Only metadata is fetched, READMEs
+    are fetched separately (see `get_readme_batch_query`). With `urls_only`,
+    only the urls of the repos are fetched.
+    """
 
+    if urls_only:
+        base_query = _REPO_URL_DISCOVERY
+    if start is None or end is None:
+        start, end = date(year, 1, 1), date(year, 12, 31)
     after_line = f'after: "{after}"' if after else ""
     return base_query.format(
-        term=term, year=year, after_line=after_line, per_page=per_page
+        term=term,
+        year=start.year,
+        start=start.isoformat(),
+        end=end.isoformat(),
+        after_line=after_line,
+        per_page=per_page,
     )
 
 
@@ -151,21 +205,120 @@ def get_stargazers_query(
     owner: str,
     name: str,
     after: str | None = None,
+    newest_first: bool = False,
     base_query: str = _STARGAZERS,
 ) -> str:
     """Get the GraphQL query string for stargazer details."""
 
     after_line = f'after: "{after}"' if after else ""
-    return base_query.format(owner=owner, name=name, after_line=after_line)
+    order_line = "orderBy: {field: STARRED_AT, direction: DESC}" if newest_first else ""
+    return base_query.format(
+        owner=owner, name=name, after_line=after_line, order_line=order_line
+    )
 
 
 def get_commits_query(
     owner: str,
     name: str,
     after: str | None = None,
+    since: datetime | None = None,
     base_query: str = _COMMITS,
 ) -> str:
-    """Get the GraphQL query string for commit details."""
+    """Get the GraphQL query string for commit details.
+
+    If `since` is given (naive datetimes are UTC), only commits from then on are included.
+    """
 
     after_line = f'after: "{after}"' if after else ""
-    return base_query.format(owner=owner, name=name, after_line=after_line)
+    since_line = f'since: "{since:%Y-%m-%dT%H:%M:%SZ}"' if since else ""
+    return base_query.format(
+        owner=owner, name=name, after_line=after_line, since_line=since_line
+    )
+
+
+def get_batch_alias(i: int) -> str:
+    """Get the alias of the i-th repository in a batched query."""
+    return f"r{i}"
+
+
+def _get_batch_query(repos: list[tuple[str, str]], fields: list[str]) -> str:
+    """Combine the selected fields of many repositories into one aliased query."""
+
+    selections = [
+        _ALIASED_REPOSITORY.format(
+            alias=get_batch_alias(i), owner=owner, name=name, fields=repo_fields
+        )
+        for i, ((owner, name), repo_fields) in enumerate(zip(repos, fields))
+    ]
+    return "{" + "".join(selections) + "\n}\n"
+
+
+def get_stargazers_batch_query(
+    repos: list[tuple[str, str]],
+    afters: list[str | None] | None = None,
+    newest_first: bool = False,
+) -> str:
+    """Get one GraphQL query for a page of stargazers of each (owner, name) repo.
+
+    Each repository is aliased by `get_batch_alias` of its position, and pages
+    after its own cursor in `afters`.
+    """
+
+    if afters is None:
+        afters = [None] * len(repos)
+    order_line = "orderBy: {field: STARRED_AT, direction: DESC}" if newest_first else ""
+    fields = [
+        _STARGAZERS_FIELDS.format(
+            after_line=f'after: "{after}"' if after else "", order_line=order_line
+        )
+        for after in afters
+    ]
+    return _get_batch_query(repos, fields)
+
+
+def get_commits_batch_query(
+    repos: list[tuple[str, str]],
+    afters: list[str | None] | None = None,
+    since: list[datetime | None] | None = None,
+) -> str:
+    """Get one GraphQL query for a page of commits of each (owner, name) repo.
+
+    Each repository is aliased by `get_batch_alias` of its position, and pages
+    after its own cursor in `afters`, from its own `since` time if given.
+    """
+
+    if afters is None:
+        afters = [None] * len(repos)
+    if since is None:
+        since = [None] * len(repos)
+    fields = [
+        _COMMITS_FIELDS.format(
+            after_line=f'after: "{after}"' if after else "",
+            since_line=f'since: "{start:%Y-%m-%dT%H:%M:%SZ}"' if start else "",
+        )
+        for after, start in zip(afters, since)
+    ]
+    return _get_batch_query(repos, fields)
+
+
+def get_repo_batch_query(repos: list[tuple[str, str]]) -> str:
+    """Get one GraphQL query for the discovery fields of each (owner, name) repo.
+
+    Used to fetch the repos a search found only the urls of, see
+    `_REPO_URL_DISCOVERY`.
+    """
+
+    fields = _REPO_FIELDS.format()
+    return _get_batch_query(repos, [fields] * len(repos))
+
+
+def get_readme_batch_query(repos: list[tuple[str, str]], text: bool = False) -> str:
+    """Get one GraphQL query for the README blob of each (owner, name) repo.
+
+    Only the size and blob id are fetched, to tell whether the README changed,
+    unless `text` is set.
+    """
+
+    blob_fields = "byteSize oid text" if text else "byteSize oid"
+    fields = [_README_FIELDS.format(blob_fields=blob_fields)] * len(repos)
+    return _get_batch_query(repos, fields)
@@ -0,0 +1,230 @@
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator
+
+DEFAULT_QUEUE_PATH = Path("data/queue.sqlite")
+
+_CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS task (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    params TEXT NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    not_before REAL NOT NULL DEFAULT 0,
+    lease_until REAL,
+    error TEXT,
+    updated_at REAL NOT NULL,
+    UNIQUE (kind, key)
+)
+"""
+_CREATE_INDEX = (
+    "CREATE INDEX IF NOT EXISTS task_status ON task (status, not_before, lease_until)"
+)
+
+# Task statuses
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+class LeaseLost(Exception):
+    """Raised when the lease of a task expired and another worker may have it."""
+
+
+@dataclass
+class Task:
+    """A unit of crawl work, like the commits of a repo or a discovery window.
+
+    `kind` is what to crawl ("discover", "commits", "stargazers"), `key` what
+    to crawl it for (a repo url, or a term and year), and `params` the options
+    of the crawl.
+    """
+
+    id: int
+    kind: str
+    key: str
+    params: dict = field(default_factory=dict)
+    attempts: int = 0
+    worker: str | None = None
+
+
+class WorkQueue:
+    """Table of crawl tasks in a SQLite file, shared by any number of workers.
+
+    Workers `claim` a task, which leases it to them for `lease_seconds`. They
+    keep the lease with `heartbeat` while working on it, and `complete` or
+    `fail` it in the end. A task whose lease expires, because its worker died,
+    is claimable again. Failed tasks are retried with exponential backoff up to
+    `max_attempts` attempts, counting expired leases.
+
+    Each process must open its own queue, SQLite connections do not survive
+    a fork.
+    """
+
+    def __init__(
+        self,
+        path: Path | str = DEFAULT_QUEUE_PATH,
+        lease_seconds: float = 300.0,
+        max_attempts: int = 3,
+        retry_delay: float = 30.0,
+    ) -> None:
+        self.path = Path(path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            self.path, timeout=60, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._transaction() as conn:
+            conn.execute(_CREATE_TABLE)
+            conn.execute(_CREATE_INDEX)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Hold the write lock of the file, so other processes wait their turn."""
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def add(self, kind: str, key: str, params: dict | None = None) -> None:
+        """Add a task, unless one of that kind and key is already queued."""
+        self.add_many([(kind, key, params)])
+
+    def add_many(self, tasks: list[tuple[str, str, dict | None]]) -> int:
+        """Add (kind, key, params) tasks at once, return the number of new ones.
+
+        A task of the same kind and key that is pending or leased is left as
+        is, one that is done or failed is queued again with the new params.
+        """
+
+        now = time.time()
+        with self._transaction() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT INTO task (kind, key, params, updated_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (kind, key) DO UPDATE SET status = ?, attempts = 0,"
+                " not_before = 0, params = excluded.params, worker = NULL,"
+                " lease_until = NULL, error = NULL, updated_at = excluded.updated_at"
+                f" WHERE status IN ('{DONE}', '{FAILED}')",
+                [
+                    (kind, key, json.dumps(params or {}), now, PENDING)
+                    for kind, key, params in tasks
+                ],
+            )
+            return conn.total_changes - before
+
+    def claim(self, worker: str, kinds: list[str] | None = None) -> Task | None:
+        """Lease the next available task to a worker, None if there is none."""
+
+        now = time.time()
+        kind_filter = ""
+        if kinds:
+            kind_filter = f" AND kind IN ({', '.join('?' * len(kinds))})"
+        with self._transaction() as conn:
+            # Give up on tasks whose last allowed attempt died with its worker
+            conn.execute(
+                "UPDATE task SET status = ?, error = 'Lease expired', updated_at = ?"
+                " WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                (FAILED, now, LEASED, now, self.max_attempts),
+            )
+            row = conn.execute(
+                "SELECT id, kind, key, params, attempts FROM task"
+                " WHERE ((status = ? AND not_before <= ?)"
+                " OR (status = ? AND lease_until < ?))" + kind_filter + " ORDER BY id"
+                " LIMIT 1",
+                (PENDING, now, LEASED, now, *(kinds or [])),
+            ).fetchone()
+            if row is None:
+                return None
+
+            task_id, kind, key, params, attempts = row
+            conn.execute(
+                "UPDATE task SET status = ?, worker = ?, attempts = ?,"
+                " lease_until = ?, updated_at = ? WHERE id = ?",
+                (LEASED, worker, attempts + 1, now + self.lease_seconds, now, task_id),
+            )
+        return Task(task_id, kind, key, json.loads(params), attempts + 1, worker)
+
+    def _update_leased(self, task: Task, assignments: str, values: tuple) -> bool:
+        """Update a task if the worker still holds its lease."""
+
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                f"UPDATE task SET {assignments}, updated_at = ?"
+                " WHERE id = ? AND status = ? AND worker = ? AND attempts = ?",
+                (*values, time.time(), task.id, LEASED, task.worker, task.attempts),
+            )
+            return cursor.rowcount == 1
+
+    def heartbeat(self, task: Task) -> bool:
+        """Extend the lease of a task, False if it was lost to another worker."""
+
+        lease_until = time.time() + self.lease_seconds
+        return self._update_leased(task, "lease_until = ?", (lease_until,))
+
+    def complete(self, task: Task) -> bool:
+        """Mark a task as done, False if its lease was lost."""
+        return self._update_leased(task, "status = ?, error = NULL", (DONE,))
+
+    def fail(self, task: Task, error: str) -> bool:
+        """Put a failed task back in the queue for a later retry, or give up on it.
+
+        Returns False if its lease was lost.
+        """
+
+        if task.attempts >= self.max_attempts:
+            return self._update_leased(task, "status = ?, error = ?", (FAILED, error))
+        not_before = time.time() + self.retry_delay * 2 ** (task.attempts - 1)
+        return self._update_leased(
+            task,
+            "status = ?, error = ?, not_before = ?, lease_until = NULL",
+            (PENDING, error, not_before),
+        )
+
+    def counts(self) -> dict[str, int]:
+        """Number of tasks by status."""
+
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM task GROUP BY status"
+            ).fetchall()
+        return {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0, **dict(rows)}
+
+    def is_finished(self) -> bool:
+        """Whether every task is done or failed for good."""
+
+        counts = self.counts()
+        return counts[PENDING] == 0 and counts[LEASED] == 0
+
+    def retry_failed(self) -> int:
+        """Give the tasks that failed for good a new set of attempts."""
+
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE task SET status = ?, attempts = 0, not_before = 0,"
+                " updated_at = ? WHERE status = ?",
+                (PENDING, time.time(), FAILED),
+            )
+            return cursor.rowcount
+
+    def close(self) -> None:
+        self._conn.close()
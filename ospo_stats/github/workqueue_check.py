@@ -0,0 +1,202 @@
+"""Check the `WorkQueue` with several processes sharing one SQLite file.
+
+    python -m ospo_stats.github.workqueue_check --workers 8 --tasks 2000
+
+Each check runs on a fresh queue file and fails with an `AssertionError`:
+claims are exactly once under concurrent workers, a task whose worker died
+is claimable again once its lease expires, heartbeats keep a lease, failed
+tasks are retried after their backoff, tasks give up after `max_attempts`,
+whether they fail or their workers die, and finished tasks can be queued
+again.
+"""
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from multiprocessing import get_context
+from pathlib import Path
+
+from ospo_stats.github.workqueue import (
+    DONE,
+    FAILED,
+    LEASED,
+    PENDING,
+    Task,
+    WorkQueue,
+)
+
+
+def _work(path: Path, worker: str, start_at: float) -> list[str]:
+    """Claim and complete tasks until none is left, return their keys."""
+
+    queue = WorkQueue(path)
+    time.sleep(max(start_at - time.time(), 0))  # Start with the other workers
+    keys = []
+    while (task := queue.claim(worker)) is not None:
+        keys.append(task.key)
+        assert queue.complete(task), f"{worker} lost the lease of {task.key}"
+    queue.close()
+    return keys
+
+
+def _die_holding_a_task(path: Path, lease_seconds: float, max_attempts: int) -> None:
+    """Claim a task and exit without completing it, like a crashed worker."""
+
+    queue = WorkQueue(path, lease_seconds=lease_seconds, max_attempts=max_attempts)
+    assert queue.claim("doomed") is not None
+    os._exit(0)
+
+
+def _kill_worker(path: Path, lease_seconds: float, max_attempts: int = 3) -> None:
+    process = get_context("fork").Process(
+        target=_die_holding_a_task, args=(path, lease_seconds, max_attempts)
+    )
+    process.start()
+    process.join()
+
+
+def check_exactly_once(path: Path, workers: int, n_tasks: int) -> None:
+    """Every task is claimed by exactly one of many concurrent workers."""
+
+    queue = WorkQueue(path)
+    keys = [f"https://github.com/o/repo-{i}" for i in range(n_tasks)]
+    assert queue.add_many([("commits", key, None) for key in keys]) == n_tasks
+    assert queue.add_many([("commits", keys[0], None)]) == 0  # Already queued
+    queue.close()
+
+    start_at = time.time() + 1.0
+    with ProcessPoolExecutor(workers, mp_context=get_context("fork")) as executor:
+        claimed = list(
+            executor.map(
+                _work,
+                [path] * workers,
+                [f"worker-{i}" for i in range(workers)],
+                [start_at] * workers,
+            )
+        )
+
+    all_claimed = [key for keys in claimed for key in keys]
+    assert len(all_claimed) == len(set(all_claimed)), "A task was claimed twice"
+    assert sorted(all_claimed) == sorted(keys), "A task was never claimed"
+    assert sum(1 for keys in claimed if keys) > 1, "Workers did not run concurrently"
+    assert WorkQueue(path).counts()[DONE] == n_tasks
+    print(f"exactly once: {n_tasks} tasks over {[len(k) for k in claimed]}")
+
+
+def check_lease_expiry(path: Path, lease_seconds: float) -> None:
+    """The task of a dead worker is held until its lease expires, not after."""
+
+    queue = WorkQueue(path, lease_seconds=lease_seconds)
+    queue.add("stargazers", "https://github.com/o/a")
+    _kill_worker(path, lease_seconds)
+
+    assert queue.claim("survivor") is None, "Claimed a task under a live lease"
+    time.sleep(lease_seconds * 1.5)
+    task = queue.claim("survivor")
+    assert task is not None and task.attempts == 2, "Expired lease not reclaimed"
+
+    # The dead worker's lease is gone, whatever it would still try
+    stale = Task(task.id, task.kind, task.key, attempts=1, worker="doomed")
+    assert not queue.heartbeat(stale)
+    assert not queue.complete(stale)
+    assert queue.complete(task)
+    print("lease expiry: reclaimed after the worker died")
+
+
+def check_heartbeat(path: Path, lease_seconds: float) -> None:
+    """A worker that heartbeats keeps its task past the first lease."""
+
+    queue = WorkQueue(path, lease_seconds=lease_seconds)
+    other = WorkQueue(path, lease_seconds=lease_seconds)
+    queue.add("commits", "https://github.com/o/b")
+    task = queue.claim("alive")
+    for _ in range(3):
+        time.sleep(lease_seconds * 0.6)
+        assert queue.heartbeat(task)
+    assert other.claim("other") is None, "Claimed a task that kept its lease"
+    assert queue.complete(task)
+    print("heartbeat: lease kept for 1.8 leases")
+
+
+def check_failures(path: Path, retry_delay: float) -> None:
+    """Failed tasks wait for their backoff, then fail for good at the cutoff."""
+
+    queue = WorkQueue(path, max_attempts=2, retry_delay=retry_delay)
+    queue.add("commits", "https://github.com/o/c")
+    assert queue.fail(queue.claim("w"), "boom")
+    assert queue.counts()[PENDING] == 1
+    assert queue.claim("w") is None, "Claimed a task during its backoff"
+
+    time.sleep(retry_delay * 1.5)
+    task = queue.claim("w")
+    assert task is not None and task.attempts == 2
+    assert queue.fail(task, "boom again")
+    assert queue.counts()[FAILED] == 1 and queue.is_finished()
+
+    assert queue.retry_failed() == 1
+    assert queue.claim("w").attempts == 1
+    print("failures: retried after the backoff, failed at max_attempts")
+
+
+def check_dead_workers_cutoff(path: Path, lease_seconds: float) -> None:
+    """A task whose workers keep dying fails once it used its attempts."""
+
+    queue = WorkQueue(path, lease_seconds=lease_seconds, max_attempts=2)
+    queue.add("commits", "https://github.com/o/d")
+    for _ in range(2):
+        _kill_worker(path, lease_seconds, max_attempts=2)
+        time.sleep(lease_seconds * 1.5)
+
+    assert queue.claim("survivor") is None, "Claimed a task past max_attempts"
+    assert queue.counts()[FAILED] == 1
+    with closing(sqlite3.connect(path)) as conn:
+        (error,) = conn.execute("SELECT error FROM task").fetchone()
+    assert error == "Lease expired", error
+    print("dead workers: failed after max_attempts expired leases")
+
+
+def check_requeue(path: Path) -> None:
+    """Done and failed tasks are queued again with new params, others are kept."""
+
+    queue = WorkQueue(path, max_attempts=1)
+    keys = [f"https://github.com/o/{name}" for name in "efgh"]
+    queue.add_many([("commits", key, {"since": None}) for key in keys])
+    assert queue.complete(queue.claim("w"))
+    assert queue.fail(queue.claim("w"), "boom")
+    leased = queue.claim("w")
+
+    since = {"since": "2024-01-01T00:00:00"}
+    assert queue.add_many([("commits", key, since) for key in keys]) == 2
+    assert queue.counts()[PENDING] == 3 and queue.counts()[LEASED] == 1
+    assert queue.complete(leased), "Queueing again took a lease away"
+    requeued = [queue.claim("w") for _ in range(3)]
+    assert [task.key for task in requeued] == [keys[0], keys[1], keys[3]]
+    assert [task.params for task in requeued] == [since, since, {"since": None}]
+    assert all(task.attempts == 1 for task in requeued)
+    print("requeue: done and failed tasks queued again with new params")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--tasks", type=int, default=2000)
+    parser.add_argument("--lease-seconds", type=float, default=0.5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        check_exactly_once(tmp / "once.sqlite", args.workers, args.tasks)
+        check_lease_expiry(tmp / "expiry.sqlite", args.lease_seconds)
+        check_heartbeat(tmp / "heartbeat.sqlite", args.lease_seconds)
+        check_failures(tmp / "failures.sqlite", args.lease_seconds)
+        check_dead_workers_cutoff(tmp / "dead.sqlite", args.lease_seconds)
+        check_requeue(tmp / "requeue.sqlite")
+    print("All work queue checks passed")
+
+
+if __name__ == "__main__":
+    main()
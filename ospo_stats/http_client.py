@@ -0,0 +1,156 @@
+"""Shared HTTP client layer for every fetcher.
+
+Clients keep connections alive and pooled between requests, ask for gzip
+compressed responses, time out instead of hanging, and record the latency and
+bytes of each request in `STATS`, so we can see where crawl time goes:
+
+    from ospo_stats.http_client import STATS, get_client
+
+    response = get_client().get(url)
+    print(STATS)
+"""
+
+import atexit
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+
+import httpx
+import pandas as pd
+
+DEFAULT_TIMEOUT = 60.0  # Seconds, for reading, writing and waiting for a connection
+CONNECT_TIMEOUT = 10.0
+MAX_CONNECTIONS = 100
+MAX_KEEPALIVE_CONNECTIONS = 20
+DEFAULT_HEADERS = {"Accept-Encoding": "gzip"}
+
+
+@dataclass
+class HostStats:
+    """Totals of the requests sent to one host."""
+
+    requests: int = 0
+    errors: int = 0  # Responses with a 4xx or 5xx status
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+    bytes_sent: int = 0
+    bytes_received: int = 0  # On the wire, before decompression
+    bytes_decoded: int = 0
+
+
+class RequestStats:
+    """Latency and bytes of every request, aggregated per host."""
+
+    def __init__(self) -> None:
+        self.hosts: dict[str, HostStats] = defaultdict(HostStats)
+        self._lock = threading.Lock()
+
+    def record(self, response: httpx.Response) -> None:
+        """Add a response whose body was read."""
+
+        with self._lock:
+            stats = self.hosts[response.request.url.host]
+            seconds = response.elapsed.total_seconds()
+            stats.requests += 1
+            stats.errors += response.is_error
+            stats.seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.bytes_sent += len(response.request.content)
+            stats.bytes_received += response.num_bytes_downloaded
+            stats.bytes_decoded += len(response.content)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.hosts.clear()
+
+    def to_frame(self) -> pd.DataFrame:
+        """Per host totals, with the mean latency in seconds."""
+
+        with self._lock:
+            df = pd.DataFrame(
+                [{"host": host, **vars(stats)} for host, stats in self.hosts.items()]
+            )
+        if df.empty:
+            return df
+        df["mean_seconds"] = df["seconds"] / df["requests"]
+        return df.set_index("host")
+
+    def __str__(self) -> str:
+        with self._lock:
+            return "\n".join(
+                f"{host}: {s.requests} requests ({s.errors} errors),"
+                f" {s.seconds / s.requests:.3f}s mean / {s.max_seconds:.3f}s max,"
+                f" {s.bytes_received / 1e6:.1f} MB received"
+                f" ({s.bytes_decoded / 1e6:.1f} MB decoded)"
+                for host, s in self.hosts.items()
+            )
+
+
+STATS = RequestStats()
+
+
+def _client_options(timeout: float, max_connections: int, headers: dict | None) -> dict:
+    return {
+        "timeout": httpx.Timeout(timeout, connect=CONNECT_TIMEOUT),
+        "limits": httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=min(max_connections, MAX_KEEPALIVE_CONNECTIONS),
+        ),
+        "headers": {**DEFAULT_HEADERS, **(headers or {})},
+        "follow_redirects": True,
+    }
+
+
+def make_client(
+    timeout: float = DEFAULT_TIMEOUT,
+    max_connections: int = MAX_CONNECTIONS,
+    headers: dict | None = None,
+    stats: RequestStats = STATS,
+) -> httpx.Client:
+    """Create a pooled, compressed, metered HTTP client."""
+
+    def record(response: httpx.Response) -> None:
+        response.read()
+        stats.record(response)
+
+    return httpx.Client(
+        **_client_options(timeout, max_connections, headers),
+        event_hooks={"response": [record]},
+    )
+
+
+def make_async_client(
+    timeout: float = DEFAULT_TIMEOUT,
+    max_connections: int = MAX_CONNECTIONS,
+    headers: dict | None = None,
+    stats: RequestStats = STATS,
+) -> httpx.AsyncClient:
+    """Create a pooled, compressed, metered asynchronous HTTP client.
+
+    Asynchronous clients are bound to their event loop, so unlike `get_client`
+    each `asyncio.run` needs its own.
+    """
+
+    async def record(response: httpx.Response) -> None:
+        await response.aread()
+        stats.record(response)
+
+    return httpx.AsyncClient(
+        **_client_options(timeout, max_connections, headers),
+        event_hooks={"response": [record]},
+    )
+
+
+_client: httpx.Client | None = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> httpx.Client:
+    """Get the HTTP client shared by the synchronous fetchers."""
+
+    global _client
+    with _client_lock:
+        if _client is None or _client.is_closed:
+            _client = make_client()
+            atexit.register(_client.close)
+        return _client
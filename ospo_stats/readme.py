@@ -0,0 +1,186 @@
+"""README features, extracted in a single linear pass over the text.
+
+    features = analyze_readme(text)
+    features.images, features.badges, features.has_image
+
+Every pattern of the scanner stops at the first character that cannot
+belong to its match, like a bracket or a line break, and the urls of images
+and links are matched possessively (`*+`), so no input makes it backtrack:
+the time grows linearly with the size of the README. Run
+`python -m ospo_stats.readme` to benchmark it on pathological inputs against
+the regexes it replaces.
+"""
+
+import argparse
+import re
+import time
+from dataclasses import asdict, dataclass
+from typing import Iterable
+from urllib.parse import urlsplit
+
+import pandas as pd
+
+# Hosts that serve status badges, on top of any image url containing "badge"
+BADGE_HOSTS = {
+    "img.shields.io",
+    "shields.io",
+    "badgen.net",
+    "badge.fury.io",
+    "travis-ci.org",
+    "travis-ci.com",
+    "circleci.com",
+    "codecov.io",
+    "coveralls.io",
+    "app.codacy.com",
+    "readthedocs.org",
+    "zenodo.org",
+    "api.netlify.com",
+    "mybinder.org",
+    "colab.research.google.com",
+}
+ICON_EXTENSIONS = (".svg", ".ico")
+
+_SCANNER = re.compile(
+    # Fenced code blocks, skipped so that their content does not count
+    r"^(?P<fence>```|~~~)[^\n]*\n(?:.*?\n)??[ \t]*(?P=fence)"
+    # ![alt](url "title")
+    r"|!\[[^\[\]\n]*\]\([ \t]*<?(?P<image>[^\s()<>]*+)[^()\n]*+\)"
+    # [text](url "title")
+    r"|\[[^\[\]\n]*\]\([ \t]*<?(?P<link>[^\s()<>]*+)[^()\n]*+\)"
+    # <img ...>, <a ...>, <h1> to <h6>, attributes parsed from the match
+    r"|<(?P<tag>img|a|h[1-6])\b(?P<attributes>[^<>]*)>"
+    # Bare urls, which GitHub turns into links
+    r"|(?P<url>https?://[^\s<>()\[\]\"'`]+)"
+    # ATX headings
+    r"|^(?P<heading>#{1,6})(?:[ \t]|$)",
+    re.MULTILINE | re.DOTALL | re.IGNORECASE,
+)
+_URL_ATTRIBUTE = re.compile(
+    r"\b(?:src|href)[ \t]*=[ \t]*[\"']?([^\"'\s>]*)", re.IGNORECASE
+)
+
+
+@dataclass
+class ReadmeFeatures:
+    """Counts of what a README contains, and its size in characters."""
+
+    size: int = 0
+    images: int = 0  # Markdown images and <img> tags, badges and icons included
+    icons: int = 0  # SVG and ICO images that are not badges
+    badges: int = 0
+    links: int = 0  # Markdown links, <a> tags and bare urls
+    headings: int = 0  # ATX (#) and HTML headings
+
+    @property
+    def has_image(self) -> bool:
+        return self.images > 0
+
+
+def _add_image(features: ReadmeFeatures, url: str) -> None:
+    features.images += 1
+    lower = url.lower()
+    if "badge" in lower or urlsplit(lower).hostname in BADGE_HOSTS:
+        features.badges += 1
+    elif lower.split("?", 1)[0].endswith(ICON_EXTENSIONS):
+        features.icons += 1
+
+
+def analyze_readme(text: str | None) -> ReadmeFeatures:
+    """Extract the features of a README in one pass, a missing one is empty."""
+
+    features = ReadmeFeatures(size=len(text or ""))
+    if not text:
+        return features
+
+    for match in _SCANNER.finditer(text):
+        kind = match.lastgroup
+        if kind == "image":
+            _add_image(features, match["image"])
+        elif kind == "link" or kind == "url":
+            features.links += 1
+        elif kind == "attributes":
+            tag = match["tag"].lower()
+            if tag == "img":
+                url = _URL_ATTRIBUTE.search(match["attributes"])
+                if url is not None:  # Like GitHub, images without src are not shown
+                    _add_image(features, url[1])
+            elif tag == "a":
+                features.links += 1
+            else:
+                features.headings += 1
+        elif kind == "heading":
+            features.headings += 1
+    return features
+
+
+def analyze_readmes(texts: Iterable[str | None]) -> pd.DataFrame:
+    """Extract the features of many READMEs, one row each, in their order."""
+
+    rows = [asdict(analyze_readme(text)) for text in texts]
+    df = pd.DataFrame(rows, columns=list(ReadmeFeatures.__dataclass_fields__))
+    df["has_image"] = df["images"] > 0
+    return df
+
+
+def _has_image_regexes(readme_content: str) -> bool:
+    """The regexes `analyze_readme` replaced, kept to compare against."""
+
+    markdown = re.search(r"!\[.*?\]\(.*?\)", readme_content) is not None
+    html = re.search(r"<img .*?src=\".*?\".*?>", readme_content) is not None
+    return markdown or html
+
+
+def pathological_readmes(size: int) -> dict[str, str]:
+    """READMEs of about `size` characters that make backtracking regexes slow."""
+
+    return {
+        "unclosed <img": "<img " * (size // 5),
+        "unclosed <img src": '<img src="x" ' * (size // 13),
+        "unclosed ![": "![" * (size // 2),
+        "unclosed [a](": "[a](" * (size // 4),
+        "unclosed ![a](x": "![a](" + "x" * (size - 5),
+        "unclosed [a](x": "[a](" + "x" * (size - 4),
+        "unclosed fence": "```\n" + "# a\n" * (size // 4),
+        "html table": '<td><a href="x"><img src="y.png"></a></td>\n' * (size // 42),
+        "badges": "[![ci](https://img.shields.io/badge/ci-ok-green)](x)\n"
+        * (size // 52),
+    }
+
+
+def benchmark(sizes: list[int], repeat: int = 3) -> pd.DataFrame:
+    """Time `analyze_readme` and the regexes it replaced on pathological READMEs."""
+
+    def best_time(function, text: str) -> float:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function(text)
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    rows = []
+    for size in sizes:
+        for name, text in pathological_readmes(size).items():
+            rows.append(
+                {
+                    "input": name,
+                    "size": len(text),
+                    "regexes_ms": 1000 * best_time(_has_image_regexes, text),
+                    "analyzer_ms": 1000 * best_time(analyze_readme, text),
+                }
+            )
+    return pd.DataFrame(rows).sort_values(["input", "size"], ignore_index=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the README analyzer.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[250, 500, 1000, 1500])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    pd.options.display.float_format = "{:,.2f}".format
+    print(benchmark(args.sizes, args.repeat).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
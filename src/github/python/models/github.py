@@ -15,7 +15,7 @@
 #  Copyright (C) 2024 Data Science Institute, Univeristy of Wisconsin-Madison  #
 ################################################################################
 
-import requests
+from ospo_stats.http_client import get_client
 
 class GitHub:
 
@@ -44,7 +44,7 @@ class GitHub:
 
 		# initiate the get request
 		#
-		return requests.get(url, headers = {
+		return get_client().get(url, headers = {
 			'Accept': 'application/vnd.github+json',
 			'Authorization': 'Bearer ' + self.token,
 			'X-GitHub-Api-Version': '2022-11-28',
@@ -18,7 +18,8 @@
 from models.github import GitHub
 from models.model import Model
 import json
-import requests
+from ospo_stats.http_client import get_client
+from ospo_stats.readme import analyze_readme
 import time
 import datetime
 
@@ -72,13 +73,13 @@ class Repository(Model):
 
 		# try main branch
 		#
-		request = requests.get(self.content_url() + '/main/README.md')
+		request = get_client().get(self.content_url() + '/main/README.md')
 		if (request.status_code == 200):
 			return request.text
 
 		# try master branch
 		#
-		request = requests.get(self.content_url() + '/master/README.md')
+		request = get_client().get(self.content_url() + '/master/README.md')
 		if (request.status_code == 200):
 			return request.text
 
@@ -252,9 +253,9 @@ class Repository(Model):
 		"""
 
 		readme = self.get_readme()
-		lowercase = readme.lower() if readme else None
-		has_images = lowercase != None and ('.jpg' in lowercase or '.jpeg' in lowercase or '.png' in lowercase)
-		has_icons = lowercase != None and '.svg' in lowercase
+		features = analyze_readme(readme)
+		has_images = features.images > 0
+		has_icons = features.icons > 0
 
 		return {
 			'id': self.get('id'),
@@ -15,7 +15,7 @@
 #  Copyright (C) 2024 Data Science Institute, Univeristy of Wisconsin-Madison  #
 ################################################################################
 
-import requests
+from ospo_stats.http_client import get_client
 
 class GitLab:
 
@@ -43,6 +43,6 @@ class GitLab:
 
 		# initiate the get request
 		#
-		return requests.get(url, headers = {
+		return get_client().get(url, headers = {
 			'Authorization': 'Bearer ' + self.token
 		})
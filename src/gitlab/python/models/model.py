@@ -16,7 +16,7 @@
 #  Copyright (C) 2024 Data Science Institute, Univeristy of Wisconsin-Madison  #
 ################################################################################
 
-import requests
+from ospo_stats.http_client import get_client
 import json
 import numpy as np
 
@@ -127,7 +127,7 @@ class Model:
 
 		print("IN FETCH")
 
-		request = requests.get(self.url())
+		request = get_client().get(self.url())
 		print("TEXT = ", request.text)
 		if (request.status_code == 200):
 			self.attributes = json.loads(request.text)
@@ -18,7 +18,8 @@
 from models.gitlab import GitLab
 from models.model import Model
 import json
-import requests
+from ospo_stats.http_client import get_client
+from ospo_stats.readme import analyze_readme
 import time
 import datetime
 from dateutil.parser import parse
@@ -73,7 +74,7 @@ class Project(Model):
 		# try main branch
 		#
 		if (self.has('readme_url')):
-			request = requests.get(self.get('readme_url'))
+			request = get_client().get(self.get('readme_url'))
 			if (request.status_code == 200):
 				return request.text
 
@@ -278,9 +279,9 @@ class Project(Model):
 		"""
 
 		readme = self.get_readme()
-		lowercase = readme.lower() if readme else None
-		has_images = lowercase != None and ('.jpg' in lowercase or '.jpeg' in lowercase or '.png' in lowercase)
-		has_icons = lowercase != None and '.svg' in lowercase
+		features = analyze_readme(readme)
+		has_images = features.images > 0
+		has_icons = features.icons > 0
 
 		return {
 			'id': self.get('id'),